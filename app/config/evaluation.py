@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/config/evaluation.py
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import torch
+from fastapi import FastAPI, Request
+
+from app.config.settings import get
+from app.config.tibero import get_db_connection
+from app.model.test_metrics import StratifiedSampler
+from app.util.lru_cache import LRUCache
+from app.util.metrics import metrics
+from kernel.kernel_dataset import DatasetCache, NormalizeCollate, decode_images
+from kernel.kernel_metrics import ConfusionMatrix, wilson_interval
+
+settings = get()
+
+EVALUATION_BATCH_SIZE = 256
+
+# Per worker process: (path, mtime_ns, size) -> TorchScript model
+_models: LRUCache[torch.jit.ScriptModule] = LRUCache(4)
+
+
+def _init_worker(cpu_slices: multiprocessing.Queue) -> None:
+    # Same limits as a kernel: pinned to its own cores, thread pools sized
+    # to them.
+    cpus = cpu_slices.get()
+    os.sched_setaffinity(0, cpus)
+
+    threads = str(len(cpus))
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["MKL_NUM_THREADS"] = threads
+    torch.set_num_threads(len(cpus))
+
+
+def _load_model(path: str) -> torch.jit.ScriptModule:
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+
+    model = _models.get(key)
+    if model is None:
+        model = torch.jit.load(path, map_location="cpu")
+        model.eval()
+        _models.put(key, model)
+
+    return model
+
+
+def _update(
+    confusion: ConfusionMatrix,
+    model: torch.jit.ScriptModule,
+    labels: List,
+    blobs: List[bytes],
+) -> None:
+    collate = NormalizeCollate(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+
+    # A pool worker cannot start a decoding pool of its own.
+    images = decode_images(blobs, workers=1)
+    labels = np.asarray(labels, dtype=np.int64)
+
+    for start in range(0, len(labels), EVALUATION_BATCH_SIZE):
+        end = start + EVALUATION_BATCH_SIZE
+        inputs, targets = collate((images[start:end], labels[start:end]))
+        with torch.inference_mode():
+            outputs = model(inputs)
+        confusion.update(targets, torch.argmax(outputs, dim=1))
+
+
+def _evaluate(
+    model_path: str,
+    table: str,
+    label_column: str,
+    data_column: str,
+    key_column: str | None,
+    cache_path: str,
+) -> Dict:
+    model = _load_model(model_path)
+    confusion = ConfusionMatrix()
+
+    conn = get_db_connection()
+    try:
+        for labels, blobs in DatasetCache(cache_path).iter_shards(
+            conn, table, label_column, data_column, key_column, log=lambda *_: None
+        ):
+            _update(confusion, model, labels, blobs)
+    finally:
+        conn.close()
+
+    return confusion.compute()
+
+
+def _evaluate_sample(
+    model_path: str,
+    table: str,
+    label_column: str,
+    data_column: str,
+    sample: int,
+    ci_width: float | None,
+    max_sample: int,
+    confidence: float,
+) -> Dict:
+    """
+    Evaluate stratified samples of `sample` rows until the accuracy
+    interval is at most `ci_width` percentage points wide (one round when
+    None), `max_sample` rows were drawn or the table runs out.
+    """
+    model = _load_model(model_path)
+    confusion = ConfusionMatrix()
+
+    conn = get_db_connection()
+    try:
+        sampler = StratifiedSampler(conn, table, label_column, data_column)
+
+        rounds = 0
+        while not sampler.exhausted:
+            size = min(sample, max_sample - int(confusion.matrix.sum()))
+            labels, blobs = sampler.draw(size) if size > 0 else ([], [])
+            if not labels:
+                break
+
+            _update(confusion, model, labels, blobs)
+            rounds += 1
+
+            interval = wilson_interval(
+                int(confusion.matrix.trace()), int(confusion.matrix.sum()), confidence
+            )
+            if ci_width is None or 100 * (interval[1] - interval[0]) <= ci_width:
+                break
+    finally:
+        conn.close()
+
+    result = confusion.compute()
+    interval = wilson_interval(
+        int(confusion.matrix.trace()), int(confusion.matrix.sum()), confidence
+    )
+    result["sample"] = {
+        "rows": result["total"],
+        "population": sampler.population,
+        "rounds": rounds,
+        "confidence": confidence,
+        "intervals": {
+            # Wilson, in % like the accuracy
+            "accuracy": [100 * bound for bound in interval] if interval else None,
+            # stratified bootstrap
+            **confusion.bootstrap(confidence=confidence),
+        },
+    }
+
+    return result
+
+
+class EvaluationPool(object):
+    """
+    Process pool in the API server that evaluates trained models on a test
+    table without spawning a kernel. Each worker is pinned to its own slice
+    of cores and keeps its recently used models loaded.
+
+    `evaluate` returns None when every worker is busy; the caller then uses
+    a kernel instead of queueing here.
+    """
+
+    workers: int
+    cache_path: str
+    running: int
+
+    _cpu_slices: List[List[int]]
+    _executor: ProcessPoolExecutor | None
+
+    def __init__(self, workers: int, cpus_per_worker: int, cache_path: str) -> None:
+        self.workers = workers
+        self.cache_path = cache_path
+        self.running = 0
+
+        cpus = sorted(os.sched_getaffinity(0))
+        size = cpus_per_worker or max(len(cpus) // max(workers, 1), 1)
+        self._cpu_slices = [
+            cpus[i * size : (i + 1) * size] or cpus[-size:] for i in range(workers)
+        ]
+        self._executor = None
+
+        metrics.gauge("evaluation.running", lambda: self.running)
+
+    def _start(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # fork is unsafe here: the API server runs JVM and zmq threads.
+            context = multiprocessing.get_context("forkserver")
+            cpu_slices = context.Queue()
+            for cpus in self._cpu_slices:
+                cpu_slices.put(cpus)
+
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(cpu_slices,),
+            )
+
+        return self._executor
+
+    async def _submit(self, timer: str, fn: Callable, *args: Any) -> Any:
+        self.running += 1
+        try:
+            with metrics.timer(timer):
+                return await asyncio.wrap_future(self._start().submit(fn, *args))
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a new pool.
+            self.stop()
+            raise
+        finally:
+            self.running -= 1
+
+    async def evaluate(
+        self,
+        model_path: str,
+        table: str,
+        label_column: str,
+        data_column: str,
+        key_column: str | None = None,
+    ) -> Dict | None:
+        if self.running >= self.workers:
+            metrics.inc("evaluation.saturated")
+            return None
+
+        return await self._submit(
+            "evaluation.local",
+            _evaluate,
+            model_path,
+            table,
+            label_column,
+            data_column,
+            key_column,
+            self.cache_path,
+        )
+
+    async def evaluate_sample(
+        self,
+        model_path: str,
+        table: str,
+        label_column: str,
+        data_column: str,
+        sample: int,
+        ci_width: float | None = None,
+        max_sample: int = 100000,
+        confidence: float = 0.95,
+    ) -> Dict:
+        # Samples are small, so they wait for a worker instead of a kernel.
+        return await self._submit(
+            "evaluation.sample",
+            _evaluate_sample,
+            model_path,
+            table,
+            label_column,
+            data_column,
+            sample,
+            ci_width,
+            max_sample,
+            confidence,
+        )
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def init(app: FastAPI) -> None:
+    app.ep = EvaluationPool(
+        settings.evaluation_workers,
+        settings.evaluation_cpus_per_worker,
+        settings.evaluation_cache_path,
+    )
+
+
+def stop(app: FastAPI) -> None:
+    app.ep.stop()
+
+
+def get_evaluation_pool(request: Request) -> EvaluationPool:
+    return request.app.ep
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/config/inference.py
+
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import Future
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+from typing import Dict, List, NamedTuple, Tuple
+
+import torch
+from fastapi import FastAPI, Request
+
+from app.config.settings import get
+from app.util.metrics import metrics
+
+settings = get()
+
+ModelKey = Tuple[str, int, int]  # (path, mtime_ns, size)
+
+
+def get_device() -> torch.device:
+    return torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+def get_module_size(module: torch.nn.Module) -> int:
+    tensors = [*module.parameters(), *module.buffers()]
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class ModelCache(object):
+    """
+    Process-wide LRU cache of loaded TorchScript models.
+
+    Entries are keyed by path, mtime and size, so a rewritten artifact is
+    loaded again. The total size of the cached parameters and buffers is
+    kept under `budget` bytes. Concurrent misses on the same key wait for
+    a single load.
+    """
+
+    budget: int
+    warmup_iters: int
+    device: torch.device
+
+    _entries: "OrderedDict[ModelKey, Tuple[torch.jit.ScriptModule, int]]"
+    _loading: Dict[ModelKey, Future]
+    _size: int
+    _lock: Lock
+
+    def __init__(self, budget: int, warmup_iters: int = 2) -> None:
+        self.budget = budget
+        self.warmup_iters = warmup_iters
+        self.device = get_device()
+
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._size = 0
+        self._lock = Lock()
+
+        metrics.gauge("model_cache.entries", lambda: len(self._entries))
+        metrics.gauge("model_cache.bytes", lambda: self._size)
+
+    def _get_key(self, path: str) -> ModelKey:
+        stat = os.stat(path)
+        return path, stat.st_mtime_ns, stat.st_size
+
+    def _load(
+        self, path: str, example: torch.Tensor | None
+    ) -> Tuple[torch.jit.ScriptModule, int]:
+        start = perf_counter()
+
+        model = torch.jit.load(path, map_location=self.device)
+        model.eval()
+
+        # The first calls of a TorchScript module run the profiling
+        # executor; run them here instead of on the first requests.
+        if example is not None:
+            with torch.inference_mode():
+                example = torch.zeros_like(example, device=self.device)
+                for _ in range(self.warmup_iters):
+                    model(example)
+
+        metrics.observe("model_cache.load", perf_counter() - start)
+
+        return model, get_module_size(model)
+
+    def _insert(self, key: ModelKey, model: torch.jit.ScriptModule, size: int):
+        # Older versions of the same artifact can never be hit again.
+        for old in [k for k in self._entries if k[0] == key[0]]:
+            self._size -= self._entries.pop(old)[1]
+
+        self._entries[key] = (model, size)
+        self._size += size
+
+        while self._size > self.budget and len(self._entries) > 1:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= evicted
+            metrics.inc("model_cache.eviction")
+
+    def get(
+        self, path: str, example: torch.Tensor | None = None
+    ) -> torch.jit.ScriptModule:
+        key = self._get_key(path)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                metrics.inc("model_cache.hit")
+                return self._entries[key][0]
+
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = self._loading[key] = Future()
+
+        if not owner:
+            metrics.inc("model_cache.shared_load")
+            return future.result()
+
+        metrics.inc("model_cache.miss")
+        try:
+            model, size = self._load(path, example)
+
+            with self._lock:
+                self._insert(key, model, size)
+
+            future.set_result(model)
+            return model
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._loading[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+model_cache = ModelCache(
+    settings.inference_cache_bytes, settings.inference_warmup_iters
+)
+
+
+class InferenceRequest(NamedTuple):
+    input: torch.Tensor  # (1, C, H, W)
+    future: Future
+    created_at: float
+
+
+class ModelWorker(Thread):
+    """
+    Dedicated thread running batched forward passes for one model.
+
+    Requests queued within `max_latency` seconds of the first one (up to
+    `max_batch_size`) are concatenated into a single forward pass.
+    """
+
+    path: str
+    queue: "Queue[InferenceRequest | None]"
+
+    _engine: "InferenceEngine"
+
+    def __init__(self, engine: "InferenceEngine", path: str) -> None:
+        super().__init__(name=f"inference {path}", daemon=True)
+
+        self.path = path
+        self.queue = Queue()
+
+        self._engine = engine
+
+    def _collect(self, first: InferenceRequest) -> List[InferenceRequest]:
+        batch = [first]
+        deadline = monotonic() + self._engine.max_latency
+
+        while len(batch) < self._engine.max_batch_size:
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                request = self.queue.get(timeout=timeout)
+            except Empty:
+                break
+
+            if request is None:
+                self.queue.put(None)  # handled by the next `run` iteration
+                break
+
+            batch.append(request)
+
+        return batch
+
+    def _forward(self, batch: List[InferenceRequest]) -> None:
+        try:
+            model = model_cache.get(self.path, example=batch[0].input)
+
+            with torch.inference_mode(), metrics.timer("inference.forward"):
+                inputs = torch.cat([request.input for request in batch])
+                outputs = model(inputs.to(model_cache.device)).cpu()
+
+            metrics.inc("inference.batch")
+            metrics.inc("inference.batched_request", len(batch))
+
+            now = monotonic()
+            for request, output in zip(batch, outputs.split(1)):
+                metrics.observe("inference.latency", now - request.created_at)
+                request.future.set_result(output)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    def run(self) -> None:
+        while True:
+            try:
+                request = self.queue.get(timeout=self._engine.idle_timeout)
+            except Empty:
+                if self._engine.release(self):
+                    return
+                continue
+
+            if request is None:
+                return
+
+            # Inputs of different shapes cannot be concatenated.
+            groups: Dict[torch.Size, List[InferenceRequest]] = {}
+            for request in self._collect(request):
+                groups.setdefault(request.input.shape[1:], []).append(request)
+
+            for batch in groups.values():
+                self._forward(batch)
+
+
+class InferenceEngine(object):
+    max_batch_size: int
+    max_latency: float  # seconds
+    idle_timeout: float  # seconds
+
+    _workers: Dict[str, ModelWorker]
+    _lock: Lock
+
+    def __init__(
+        self, max_batch_size: int, max_latency: float, idle_timeout: float
+    ) -> None:
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.idle_timeout = idle_timeout
+
+        self._workers = {}
+        self._lock = Lock()
+
+        metrics.gauge("inference.workers", lambda: len(self._workers))
+
+    def submit(self, path: str, input: torch.Tensor) -> Future:
+        future = Future()
+
+        with self._lock:
+            if path not in self._workers:
+                self._workers[path] = ModelWorker(self, path)
+                self._workers[path].start()
+
+            self._workers[path].queue.put(InferenceRequest(input, future, monotonic()))
+
+        return future
+
+    async def infer(self, path: str, input: torch.Tensor) -> torch.Tensor:
+        return await asyncio.wrap_future(self.submit(path, input))
+
+    def release(self, worker: ModelWorker) -> bool:
+        # Called by an idle worker; `submit` holds the same lock, so no
+        # request can be queued to a worker after it has been released.
+        with self._lock:
+            if not worker.queue.empty():
+                return False
+
+            if self._workers.get(worker.path) is worker:
+                del self._workers[worker.path]
+            return True
+
+    def stop(self) -> None:
+        with self._lock:
+            workers = [*self._workers.values()]
+            self._workers.clear()
+
+        for worker in workers:
+            worker.queue.put(None)
+        for worker in workers:
+            worker.join()
+
+
+def init(app: FastAPI) -> None:
+    app.ie = InferenceEngine(
+        settings.inference_max_batch_size,
+        settings.inference_max_latency_ms / 1000,
+        settings.inference_idle_timeout,
+    )
+
+
+def stop(app: FastAPI) -> None:
+    app.ie.stop()
+
+
+def get_engine(request: Request) -> InferenceEngine:
+    return request.app.ie
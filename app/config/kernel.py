@@ -6,6 +6,7 @@ import asyncio
 import sys
 from enum import Enum, unique
 from typing import Any, Dict, List
+from uuid import uuid4
 
 from anyio import sleep
 from fastapi import FastAPI, Request
@@ -15,12 +16,42 @@ from zmq import DEALER, REQ, SUB
 from zmq.eventloop.zmqstream import ZMQStream
 
 from app.config.settings import get
-from kernel.kernel_message import ClientMessage, MasterMessage, NodeType
+from app.model.train_metric import save_train_metrics
+from kernel.kernel_message import (
+    ClientMessage,
+    ConnectionMessage,
+    KernelMessage,
+    MasterMessage,
+    NodeType,
+)
 from kernel.kernel_node import Flow, KernelNode
 
 settings = get()
 
 
+class ExecutionError(Exception):
+    """
+    A checked cell raised, or one evaluated for a result sent none; `reply`
+    is its output.
+    """
+
+    reply: List[str]
+
+    def __init__(self, reply: List[str]) -> None:
+        super().__init__("\n".join(reply)[-4000:] or "no result")
+        self.reply = reply
+
+
+class KernelStoppedError(Exception):
+    """
+    The kernel stopped (e.g. its heartbeat failed) while a request to it was
+    pending or before it was sent.
+    """
+
+    def __init__(self, kernel_id: str) -> None:
+        super().__init__(f"kernel {kernel_id} stopped")
+
+
 @unique
 class Status(Enum):
     IDLE = "idle"
@@ -29,12 +60,15 @@ class Status(Enum):
 
 class KernelConnection(KernelNode):
     id: str  # uuid4
+    cpus: List[int]  # cores the kernel is pinned to
     alive: bool
     status: Status
     executed: int
     executing: int
     reply: Dict[str, List[str]]
     reply_futures: Dict[str, asyncio.Future]
+    reply_status: Dict[str, str]  # by msg_id: "ok" | "error" | "aborted"
+    result_futures: Dict[str, asyncio.Future]  # by msg_id, see evaluate()
 
     _client: Any
     _process_key: bytes
@@ -44,7 +78,7 @@ class KernelConnection(KernelNode):
     _hb_start_handle: Any
     _hb_handle: ioloop.PeriodicCallback
 
-    def __init__(self, client, kernel_id, connection) -> None:
+    def __init__(self, client, kernel_id, connection, cpus=None) -> None:
         context = super().__init__(
             NodeType.Connection,
             root_path=f"{settings.kernel_root}/{kernel_id}",
@@ -53,12 +87,15 @@ class KernelConnection(KernelNode):
         self._client = client
 
         self.id = kernel_id
+        self.cpus = cpus or []
         self.alive = False
         self.status = Status.IDLE
         self.executed = 0
         self.executing = 0
         self.reply = {}
         self.reply_futures = {}
+        self.reply_status = {}
+        self.result_futures = {}
 
         self._process_key = connection["process_key"].encode()
         self.connect(
@@ -85,6 +122,11 @@ class KernelConnection(KernelNode):
 
         self._start_hb()
 
+        # Kernel Events
+        self.listen(KernelMessage.RES_RENDEZVOUS, self.on_res_rendezvous)
+        self.listen(KernelMessage.TRAIN_METRICS, self.on_train_metrics)
+        self.listen(KernelMessage.EXECUTE_RESULT, self.on_execute_result)
+
     def _start_hb(self):
         hb = self._channels["hb"]
 
@@ -127,6 +169,13 @@ class KernelConnection(KernelNode):
         for stream in self._channels.values():
             stream.close()
 
+        # Nothing will answer the pending requests any more.
+        futures = [*self.reply_futures.values(), *self.result_futures.values()]
+        futures += [flow.future for flow in self._flows.values() if flow.future]
+        for future in futures:
+            if not future.done():
+                future.set_exception(KernelStoppedError(self.id))
+
         del self._client.kernels[self.id]
 
         await super().stop(io_stop=False)
@@ -152,12 +201,20 @@ class KernelConnection(KernelNode):
                     )  # XXX: logger
                     self.reply[id].append("\n".join(msg["content"]["traceback"]))
                 elif type == "execute_reply":
+                    self.reply_status[id] = msg["content"]["status"]
                     self.reply_futures[id].set_result(self.reply[id])
 
-    async def execute(self, code, msg_id: str | None = None) -> str:
-        while not self.status is Status.IDLE:
+    async def execute(self, code, msg_id: str | None = None, check=False) -> str:
+        """
+        Run `code` and return its output lines. With `check`, a cell that
+        raises raises ExecutionError instead.
+        """
+        while self.alive and not self.status is Status.IDLE:
             await sleep(0.1)
 
+        if not self.alive:
+            raise KernelStoppedError(self.id)
+
         msg = self._session.msg(
             "execute_request",
             {
@@ -180,16 +237,89 @@ class KernelConnection(KernelNode):
 
         self._session.send(self._channels["shell"], msg)
 
-        reply = await self.reply_futures[msg_id]
-        del self.reply_futures[msg_id]
+        try:
+            reply = await self.reply_futures[msg_id]
+        finally:
+            del self.reply_futures[msg_id]
+
+        if self.reply_status.pop(msg_id, "ok") != "ok" and check:
+            raise ExecutionError(reply)
 
         return reply
 
+    async def evaluate(
+        self, code, msg_id: str | None = None, timeout: float = 1.0
+    ) -> Any:
+        """
+        Execute `code`, which reports its result with `_SERVER.send_result`,
+        and return that result. Raises ExecutionError with the cell output if
+        none arrives within `timeout` seconds after the cell finished.
+        """
+        msg_id = msg_id or str(uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self.result_futures[msg_id] = future
+
+        try:
+            reply = await self.execute(code, msg_id)
+            try:
+                # The result comes over the node socket, not the shell one.
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise ExecutionError(reply)
+        finally:
+            self.result_futures.pop(msg_id, None)
+
+    def on_execute_result(self, _, body, **__) -> None:
+        future = self.result_futures.get(body["msg_id"])
+        if future and not future.done():
+            future.set_result(body["result"])
+
     async def send_file(self, *args, **kwargs):
+        if not self.alive:
+            raise KernelStoppedError(self.id)
+
         await super().send_file(*args, id=self._process_key, **kwargs)
 
+    async def rendezvous(
+        self, rank: int, world_size: int, addr: str | None = None, port: int = 0
+    ) -> Dict:
+        flow = self.new_flow(future=True)
+
+        self.send(
+            ConnectionMessage.REQ_RENDEZVOUS,
+            id=self._process_key,
+            json_body={
+                "rank": rank,
+                "world_size": world_size,
+                "addr": addr,
+                "port": port,
+            },
+            flow=flow,
+        )
+
+        return await flow.future
+
+    def on_res_rendezvous(self, _, rendezvous, flow: Flow) -> None:
+        flow.future.set_result(rendezvous)
+        self.del_flow(flow)
+
+    def on_train_metrics(self, _, body, **__) -> None:
+        def on_saved(future: asyncio.Future) -> None:
+            if not future.cancelled() and future.exception():
+                print(f"train metrics: {future.exception()}")  # XXX: logger
+
+        # One batch per transaction, off the event loop.
+        future = asyncio.get_running_loop().run_in_executor(
+            None, save_train_metrics, body["train_id"], body["records"]
+        )
+        future.add_done_callback(on_saved)
+
     async def clear_workspace(self, *args, **kwargs):
-        await super().clear_workspace(*args, id=self._process_key, **kwargs)
+        try:
+            if self.alive:
+                await super().clear_workspace(*args, id=self._process_key, **kwargs)
+        except KernelStoppedError:
+            pass  # the provider removes the workspace of a stopped kernel
 
 
 class KernelClient(KernelNode):
@@ -201,6 +331,7 @@ class KernelClient(KernelNode):
 
         # Master Events
         self.listen(MasterMessage.RES_KERNEL, self.on_res_kernel)
+        self.listen(MasterMessage.RES_KERNEL_GROUP, self.on_res_kernel_group)
 
     def on_res_kernel(self, _, connection, flow: Flow) -> None:
         kernel = None
@@ -213,6 +344,26 @@ class KernelClient(KernelNode):
         flow.future.set_result(kernel)
         self.del_flow(flow)
 
+    def on_res_kernel_group(self, _, connections, flow: Flow) -> None:
+        kernels = []
+
+        for connection in connections or []:
+            kernel = None
+            if connection:
+                kernel = KernelConnection(self, **connection)
+                kernel.run(io_stop=False)
+                self.kernels[kernel.id] = kernel
+            kernels.append(kernel)
+
+        if flow.future is None:
+            # A member that started after its group had failed.
+            for kernel in kernels:
+                if kernel:
+                    asyncio.ensure_future(kernel.stop())
+        else:
+            flow.future.set_result(kernels)
+        self.del_flow(flow)
+
     async def create_kernel(self, auto_clear=False) -> KernelConnection:
         flow = self.new_flow(future=True)
 
@@ -229,6 +380,35 @@ class KernelClient(KernelNode):
 
         return await flow.future
 
+    async def create_kernel_group(
+        self, size: int, auto_clear=False
+    ) -> List[KernelConnection] | None:
+        """
+        Allocate `size` kernels at once; all of them or none.
+        """
+        flow = self.new_flow(future=True)
+
+        self.send(
+            ClientMessage.REQ_KERNEL_GROUP,
+            json_body={
+                "db": settings.get_db_info(),
+                "log": settings.get_log_info(),
+                "auto_clear": auto_clear,
+                "size": size,
+            },
+            flow=flow,
+            to_master=True,
+        )
+
+        kernels = await flow.future
+        if kernels and all(kernels):
+            return kernels
+
+        for kernel in kernels or []:
+            if kernel:
+                await kernel.stop()
+        return None
+
     async def on_stop(self) -> Any:
         for kernel in [*self.kernels.values()]:
             await kernel.stop()
@@ -240,6 +420,7 @@ class KernelClient(KernelNode):
         return [
             {
                 "kid": kernel.id,
+                "cpus": kernel.cpus,
                 "executed": kernel.executed,
                 "executing": kernel.executing,
                 "status": kernel.status,
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/config/scheduler.py
+
+import asyncio
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from app.config.database import SessionFactory
+from app.config.kernel import KernelClient, KernelConnection
+from app.config.settings import get
+from app.config.tibero import get_db_connection
+from app.model.job import TrainJobEntity, create_train_kernels, train_task
+from app.model.model import get_model_from_db
+from app.model.train import (
+    RequestTrain,
+    get_parent_model_path,
+    get_train_artifact_path,
+    get_train_by_id,
+    get_train_hwm,
+)
+from app.util.metrics import metrics
+
+settings = get()
+
+
+class JobDispatcher(object):
+    """
+    Launches queued train jobs from the meta DB as kernel capacity frees up.
+
+    Jobs are taken by priority, then in arrival order. A tenant never has
+    more than `tenant_limit` running jobs, and the server never more than
+    `max_running`. Jobs left running by a previous server process are
+    queued again and resume from their latest checkpoint.
+    """
+
+    kc: KernelClient
+    max_running: int
+    tenant_limit: int
+    poll_interval: float  # seconds
+
+    _running: Dict[int, asyncio.Task]  # job id -> task
+    _wakeup: asyncio.Event
+    _task: asyncio.Task | None
+
+    def __init__(
+        self,
+        kc: KernelClient,
+        max_running: int,
+        tenant_limit: int,
+        poll_interval: float,
+    ) -> None:
+        self.kc = kc
+        self.max_running = max_running
+        self.tenant_limit = tenant_limit
+        self.poll_interval = poll_interval
+
+        self._running = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        metrics.gauge("job.running", lambda: len(self._running))
+        metrics.gauge("job.queued", self.count_queued)
+
+    def count_queued(self) -> int:
+        session = SessionFactory()
+        try:
+            return (
+                session.query(TrainJobEntity)
+                .filter(TrainJobEntity.status == "queued")
+                .count()
+            )
+        finally:
+            session.close()
+
+    def recover(self) -> None:
+        session = SessionFactory()
+        try:
+            for job in session.query(TrainJobEntity).filter(
+                TrainJobEntity.status == "running"
+            ):
+                job.status = "queued"
+                job.resume = True
+                metrics.inc("job.recovered")
+            session.commit()
+        finally:
+            session.close()
+
+    def start(self) -> None:
+        self.recover()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Running jobs stay "running" and are recovered on the next start.
+        tasks = [task for task in [self._task, *self._running.values()] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.dispatch()
+            except Exception as e:
+                print(f"dispatch: {e}")  # XXX: logger
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def dispatch(self) -> None:
+        if len(self._running) >= self.max_running:
+            return
+
+        session = SessionFactory()
+        try:
+            jobs: List[TrainJobEntity] = (
+                session.query(TrainJobEntity)
+                .filter(TrainJobEntity.status.in_(["queued", "running"]))
+                .order_by(TrainJobEntity.priority.desc(), TrainJobEntity.id)
+                .all()
+            )
+            tenants = Counter(job.tenant for job in jobs if job.status == "running")
+            # Smallest world_size that could not be placed in this pass; only
+            # smaller groups are tried after it, so a group that never fits
+            # does not hold back the rest of the queue.
+            unplaced = None
+
+            for job in jobs:
+                if job.status != "queued":
+                    continue
+                elif len(self._running) >= self.max_running:
+                    break
+                elif tenants[job.tenant] >= self.tenant_limit:
+                    continue
+
+                req = RequestTrain.model_validate_json(job.params)
+                if unplaced is not None and req.world_size >= unplaced:
+                    continue
+
+                kernels = await create_train_kernels(req, self.kc)
+                if not kernels:
+                    if req.world_size == 1:
+                        break  # no capacity left; retried once a job finishes
+                    unplaced = req.world_size
+                    continue
+
+                job.status = "running"
+                job.started_at = datetime.now()
+                session.commit()
+
+                tenants[job.tenant] += 1
+                metrics.observe(
+                    "job.queue_latency",
+                    (job.started_at - job.created_at).total_seconds(),
+                )
+
+                self._running[job.id] = asyncio.create_task(
+                    self._execute(job.id, req, kernels)
+                )
+        finally:
+            session.close()
+
+    def _prepare(self, job_id: int, req: RequestTrain):
+        session = SessionFactory()
+        db = get_db_connection()
+        try:
+            job = session.get(TrainJobEntity, job_id)
+            model = get_model_from_db(job.model_id, db)
+            train = get_train_by_id(job.train_id, db)
+
+            resume_path = None
+            if job.resume:
+                try:
+                    resume_path = get_train_artifact_path(train, "checkpoint", db)
+                except HTTPException:
+                    pass  # failed before its first checkpoint, start over
+
+            init_path, since = None, None
+            if req.parent_id is not None:
+                parent = get_train_by_id(req.parent_id, db)
+                init_path = get_parent_model_path(parent, db)
+                since = get_train_hwm(parent.id, db)
+
+            return model, train, resume_path, init_path, since
+        finally:
+            db.close()
+            session.close()
+
+    def _finish(self, job_id: int, error: str | None) -> None:
+        session = SessionFactory()
+        db = get_db_connection()
+        try:
+            job = session.get(TrainJobEntity, job_id)
+            train = get_train_by_id(job.train_id, db)
+
+            job.finished_at = datetime.now()
+            if error is None and train.status.strip() == "done":
+                job.status = "done"
+            else:
+                job.status = "failed"
+                job.error = error or f"train stopped at '{train.status.strip()}'"
+            session.commit()
+
+            metrics.inc(f"job.{job.status}")
+            metrics.observe(
+                "job.runtime", (job.finished_at - job.started_at).total_seconds()
+            )
+        finally:
+            db.close()
+            session.close()
+
+    async def _execute(
+        self, job_id: int, req: RequestTrain, kernels: List[KernelConnection]
+    ) -> None:
+        error = None
+        try:
+            model, train, resume_path, init_path, since = await run_in_threadpool(
+                self._prepare, job_id, req
+            )
+            await train_task(req, model, train, kernels, resume_path, init_path, since)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e)
+        finally:
+            # train_task stops them too, but not when _prepare failed;
+            # stopping twice is a no-op.
+            for kernel in kernels:
+                await kernel.stop()
+
+        try:
+            await run_in_threadpool(self._finish, job_id, error)
+        finally:
+            del self._running[job_id]
+            self.notify()
+
+
+def init(app: FastAPI) -> None:
+    app.jd = JobDispatcher(
+        app.kc,
+        settings.job_max_running,
+        settings.job_tenant_limit,
+        settings.job_poll_interval,
+    )
+    app.jd.start()
+
+
+async def stop(app: FastAPI) -> None:
+    await app.jd.stop()
+
+
+def get_dispatcher(request: Request) -> JobDispatcher:
+    return request.app.jd
@@ -23,6 +23,8 @@ class DBInfo(TypedDict):
 class LogInfo(TypedDict):
     table: str
     id_column: str
+    seq_column: str
+    sequence: str
     log_column: str
 
 
@@ -44,13 +46,37 @@ class Settings(BaseSettings):
     # Log
     log_table: str = "sys.ML_TRAIN_LOG"
     log_id_column: str = "TID"
+    log_seq_column: str = "SEQ"
+    log_sequence: str = "sys.SEQ_ML_TRAIN_LOG"
     log_data_column: str = "LOG"
+    log_poll_interval: float = 0.5  # seconds
 
     # Kernel
     kernel_master_host: str = "127.0.0.1"
     kernel_master_port: int = 8080
     kernel_root: str = f"{PROJ_PATH}/kernel_root"
 
+    # Cache
+    model_cache_size: int = 128
+    model_cache_ttl: float = 30.0  # seconds; model edits show up after this
+
+    # Inference
+    inference_cache_bytes: int = 1024 * 1024 * 1024
+    inference_warmup_iters: int = 2
+    inference_max_batch_size: int = 32
+    inference_max_latency_ms: float = 5.0  # batching window (bounds p99)
+    inference_idle_timeout: float = 60.0  # seconds
+
+    # Job
+    job_max_running: int = 4
+    job_tenant_limit: int = 2  # running jobs per tenant
+    job_poll_interval: float = 1.0  # seconds
+
+    # Evaluation
+    evaluation_workers: int = 2  # local test-metrics processes (0: kernels only)
+    evaluation_cpus_per_worker: int = 0  # 0: the API host's cores / workers
+    evaluation_cache_path: str = f"{PROJ_PATH}/kernel_root/.dataset_cache"
+
     model_config = SettingsConfigDict(env_file=".env")
 
     def get_db_info(self) -> DBInfo:
@@ -66,6 +92,8 @@ class Settings(BaseSettings):
         return {
             "table": self.log_table,
             "id_column": self.log_id_column,
+            "seq_column": self.log_seq_column,
+            "sequence": self.log_sequence,
             "log_column": self.log_data_column,
         }
 
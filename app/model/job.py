@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/model/job.py
+
+import asyncio
+import os
+from datetime import datetime
+from typing import List, Union
+
+from fastapi import HTTPException
+from pydantic import ConfigDict
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text
+from sqlalchemy.orm import Session
+
+from app.config.kernel import KernelClient, KernelConnection
+from app.model.base_model import Base, BaseEntity
+from app.model.model import Model
+from app.model.train import RequestTrain, Train
+from app.util.source_generator import (
+    get_dataloader_source,
+    get_network_source,
+    get_train_source,
+)
+
+
+class TrainJobEntity(BaseEntity):
+    model_id: Union[int, Column] = Column(Integer, nullable=False)
+    train_id: Union[int, Column] = Column(Integer, nullable=False, index=True)
+    tenant: Union[str, Column] = Column(String(255), nullable=False)
+    priority: Union[int, Column] = Column(Integer, default=0)
+    status: Union[str, Column] = Column(String(50), nullable=False, index=True)
+    params: Union[str, Column] = Column(Text, nullable=False)  # RequestTrain json
+    resume: Union[bool, Column] = Column(Boolean, default=False)
+    error: Union[str, Column] = Column(Text, nullable=True)
+    started_at: Union[datetime, Column] = Column(DateTime, nullable=True)
+    finished_at: Union[datetime, Column] = Column(DateTime, nullable=True)
+
+
+class TrainJob(Base):
+    model_id: int
+    train_id: int
+    tenant: str
+    priority: int
+    status: str
+    resume: bool
+    error: str | None
+    started_at: datetime | None
+    finished_at: datetime | None
+
+    model_config = ConfigDict(protected_namespaces=())
+
+
+def new_train_job(
+    model_id: int,
+    train_id: int,
+    req: RequestTrain,
+    tenant: str,
+    priority: int,
+    session: Session,
+    resume: bool = False,
+) -> TrainJob:
+    entity = TrainJobEntity(
+        model_id=model_id,
+        train_id=train_id,
+        tenant=tenant,
+        priority=priority,
+        status="queued",
+        params=req.model_dump_json(),
+        resume=resume,
+    )
+    session.add(entity)
+    session.commit()
+
+    return TrainJob.model_validate(entity)
+
+
+def get_train_job(train_id: int, session: Session) -> TrainJob:
+    entity = (
+        session.query(TrainJobEntity)
+        .filter(TrainJobEntity.train_id == train_id)
+        .order_by(TrainJobEntity.id.desc())
+        .first()
+    )
+    if not entity:
+        raise HTTPException(status_code=404, detail="train job not found")
+
+    return TrainJob.model_validate(entity)
+
+
+def has_active_train_job(train_id: int, session: Session) -> bool:
+    return (
+        session.query(TrainJobEntity.id)
+        .filter(
+            TrainJobEntity.train_id == train_id,
+            TrainJobEntity.status.in_(["queued", "running"]),
+        )
+        .first()
+        is not None
+    )
+
+
+async def create_train_kernels(
+    req: RequestTrain, kc: KernelClient
+) -> List[KernelConnection] | None:
+    if req.world_size > 1:
+        return await kc.create_kernel_group(req.world_size)
+
+    kernel = await kc.create_kernel()
+    return [kernel] if kernel else None
+
+
+async def rendezvous(kernels: List[KernelConnection]) -> None:
+    world_size = len(kernels)
+    master = await kernels[0].rendezvous(0, world_size)
+    for rank, kernel in enumerate(kernels[1:], 1):
+        await kernel.rendezvous(rank, world_size, master["addr"], master["port"])
+
+
+async def train_task(
+    req: RequestTrain,
+    model: Model,
+    train: Train,
+    kernels: List[KernelConnection],
+    resume_path: str | None = None,
+    init_path: str | None = None,
+    since: str | None = None,
+):
+    try:
+        if len(kernels) > 1:
+            await rendezvous(kernels)
+
+        resume_filename = None
+        if resume_path:
+            resume_filename = os.path.split(resume_path)[1]
+            for kernel in kernels:
+                await kernel.send_file(resume_path, resume_filename)
+
+        # The parent's files are named like this train's own output.
+        init_filename = None
+        if init_path:
+            init_filename = f"parent_{os.path.split(init_path)[1]}"
+            for kernel in kernels:
+                await kernel.send_file(init_path, init_filename)
+
+        # Only rank 0 reports the train status and ships the model.
+        await kernels[0].execute(
+            f"_SERVER.train_id = {train.id}", "Step 1: Set train id"
+        )
+        for source, msg_id in [
+            (
+                get_dataloader_source(
+                    req.dataset.table_name,
+                    req.dataset.label_column_name,
+                    req.dataset.data_column_name,
+                    req.testset.table_name,
+                    req.testset.label_column_name,
+                    req.testset.data_column_name,
+                    req.dataset.key_column_name,
+                    req.testset.key_column_name,
+                    since,
+                    req.replay,
+                ),
+                "Step 2: Ready dataloader",
+            ),
+            (
+                get_network_source(model),
+                "Step 3: Define network",
+            ),
+            (
+                get_train_source(
+                    model,
+                    train.id,
+                    req.num_epochs,
+                    req.mini_batches,
+                    req.quantize,
+                    req.calibration_batches,
+                    req.checkpoint_every,
+                    resume_filename,
+                    req.autocast,
+                    req.compile,
+                    req.autotune,
+                    req.profile,
+                    req.trace_start,
+                    req.trace_steps,
+                    init_filename,
+                ),
+                "Step 4: Train model",
+            ),
+        ]:
+            # A rank that fails fails the job; the finally below stops the
+            # ranks still waiting for it in a collective.
+            await asyncio.gather(
+                *[kernel.execute(source, msg_id, check=True) for kernel in kernels]
+            )
+    finally:
+        for kernel in kernels:
+            await kernel.stop()
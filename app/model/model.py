@@ -2,12 +2,19 @@
 # -*- coding: utf-8 -*-
 # app/model/model.py
 
+import hashlib
 import json
+from typing import NamedTuple
 
 from fastapi import HTTPException
 from jaydebeapi import Connection, DatabaseError
 from pydantic import BaseModel
 
+from app.config.settings import get
+from app.util.lru_cache import LRUCache
+
+settings = get()
+
 
 def default_str(dict, key, default="") -> str:
     return dict[key] if key in dict else default
@@ -66,17 +73,62 @@ class Model(BaseModel):
         return self.name.lower()
 
 
+class CachedModel(NamedTuple):
+    model: Model
+    version: str
+
+
+# Models and layers are written by other clients of the DB, never by this
+# server: an entry is revalidated against _get_model_version once it is older
+# than model_cache_ttl, so an edit shows up within that time.
+_model_cache: LRUCache[CachedModel] = LRUCache(
+    settings.model_cache_size, settings.model_cache_ttl
+)
+
+
+def _get_model_version(model_id: int, cursor) -> tuple[tuple, str] | None:
+    # ML_MODEL row + layer count/max id/content hash: cheap to read, and
+    # changes whenever a layer is added, removed or edited. Each hash is
+    # seeded with the layer id, so moving a definition to another row counts.
+    cursor.execute(f"SELECT * FROM sys.ML_MODEL WHERE ID={model_id}")
+    model_row = cursor.fetchone()
+
+    if not model_row:
+        return None
+
+    cursor.execute(
+        "SELECT COUNT(*), MAX(ID), SUM(ORA_HASH(LAYER, 4294967295, ID)) "
+        f"FROM sys.ML_MODEL_LAYER WHERE MID={model_id}"
+    )
+    layer_stat = cursor.fetchone()
+
+    version = hashlib.sha1(repr((model_row, layer_stat)).encode()).hexdigest()
+    return model_row, version
+
+
 def get_model_from_db(model_id: int, db: Connection) -> Model:
+    cached = _model_cache.get(model_id)
+    if cached:
+        return cached.model
+
     try:
         cursor = db.cursor()
 
-        cursor.execute(f"SELECT * FROM sys.ML_MODEL WHERE ID={model_id}")
-        result = cursor.fetchone()
+        result = _get_model_version(model_id, cursor)
 
         if not result:
+            _model_cache.pop(model_id)
             raise HTTPException(status_code=404, detail="model not found")
 
-        model = Model(*result)
+        model_row, version = result
+
+        # Expired but unchanged: revalidate without re-reading the layers.
+        cached = _model_cache.peek(model_id)
+        if cached and cached.version == version:
+            _model_cache.put(model_id, cached)
+            return cached.model
+
+        model = Model(*model_row)
 
         cursor.execute(f"SELECT LAYER FROM sys.ML_MODEL_LAYER WHERE MID={model_id}")
         result = cursor.fetchall()
@@ -84,8 +136,23 @@ def get_model_from_db(model_id: int, db: Connection) -> Model:
         for (json_raw,) in result:
             model.append_layer(json_raw)
 
+        _model_cache.put(model_id, CachedModel(model, version))
+
         return model
     except DatabaseError as e:
         raise HTTPException(status_code=404, detail=f"model not found: {e}")
     finally:
         cursor.close()
+
+
+def get_model_etag(model_id: int, *args) -> str | None:
+    """
+    ETag of a response derived from a cached model, or None when the cached
+    entry is missing or expired and must be revalidated against the DB.
+    """
+    cached = _model_cache.get(model_id)
+    if not cached:
+        return None
+
+    digest = hashlib.sha1(repr((cached.version, args)).encode()).hexdigest()
+    return f'"{model_id}-{digest}"'
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/model/score.py
+
+import asyncio
+import os
+from time import monotonic
+from typing import List, Union
+
+import torch
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from sqlalchemy import Column, Float, Integer, String, Text
+from sqlalchemy.orm import Session
+
+from app.config.database import SessionFactory
+from app.config.inference import model_cache
+from app.config.kernel import KernelClient
+from app.config.tibero import get_db_connection
+from app.model.base_model import Base, BaseEntity
+from app.model.train import decode_inference_image
+from app.util.metrics import metrics
+from app.util.source_generator import get_score_source
+
+INFERENCE_TABLE = "sys.ML_INFERENCE"
+
+
+class ScoreJobEntity(BaseEntity):
+    train_id: Union[int, Column] = Column(Integer, nullable=False)
+    table_name: Union[str, Column] = Column(String(255), nullable=False)
+    target_table_name: Union[str, Column] = Column(String(255), nullable=False)
+    status: Union[str, Column] = Column(String(50), nullable=False)
+    total: Union[int, Column] = Column(Integer, default=0)
+    processed: Union[int, Column] = Column(Integer, default=0)
+    rows_per_sec: Union[float, Column] = Column(Float, default=0.0)
+    error: Union[str, Column] = Column(Text, nullable=True)
+
+
+class ScorePartitionEntity(BaseEntity):
+    job_id: Union[int, Column] = Column(Integer, nullable=False, index=True)
+    partition: Union[int, Column] = Column(Integer, nullable=False)
+    kernel: Union[str, Column] = Column(String(36), nullable=True)
+    status: Union[str, Column] = Column(String(50), nullable=False)
+    attempts: Union[int, Column] = Column(Integer, default=0)
+    processed: Union[int, Column] = Column(Integer, default=0)
+    seconds: Union[float, Column] = Column(Float, default=0.0)
+    error: Union[str, Column] = Column(Text, nullable=True)
+
+
+class ScorePartition(Base):
+    partition: int
+    kernel: str | None
+    status: str
+    attempts: int
+    processed: int
+    seconds: float
+    error: str | None
+
+
+class ScoreJob(Base):
+    train_id: int
+    table_name: str
+    target_table_name: str
+    status: str
+    total: int
+    processed: int
+    rows_per_sec: float
+    error: str | None
+    partitions: List[ScorePartition] = []
+
+
+class RequestScore(BaseModel):
+    table_name: str
+    key_column_name: str
+    data_column_name: str
+    # None: sys.ML_INFERENCE (TID, KEY_ID, PREDICTION)
+    # else: a user table with the source key column and `prediction_column_name`
+    target_table_name: str | None = None
+    prediction_column_name: str = "PREDICTION"
+    batch_size: int = 256
+    width: int = 32
+    height: int = 32
+    # > 1: split the table by MOD(key, partitions) and score on that many kernels
+    partitions: int = Field(1, ge=1)
+    max_retries: int = Field(2, ge=0)
+
+
+def new_score_job(train_id: int, req: RequestScore, session: Session) -> ScoreJob:
+    entity = ScoreJobEntity(
+        train_id=train_id,
+        table_name=req.table_name,
+        target_table_name=req.target_table_name or INFERENCE_TABLE,
+        status="queued",
+    )
+    session.add(entity)
+    session.commit()
+
+    return ScoreJob.model_validate(entity)
+
+
+def get_score_job(train_id: int, job_id: int, session: Session) -> ScoreJob:
+    entity = session.get(ScoreJobEntity, job_id)
+    if not entity or entity.train_id != train_id:
+        raise HTTPException(status_code=404, detail="score job not found")
+
+    job = ScoreJob.model_validate(entity)
+    job.partitions = [
+        ScorePartition.model_validate(partition)
+        for partition in session.query(ScorePartitionEntity)
+        .filter(ScorePartitionEntity.job_id == job_id)
+        .order_by(ScorePartitionEntity.partition)
+    ]
+
+    return job
+
+
+def get_insert_prediction_sql(train_id: int, req: RequestScore) -> str:
+    if req.target_table_name:
+        return (
+            f"INSERT INTO {req.target_table_name} "
+            f"({req.key_column_name}, {req.prediction_column_name}) VALUES (?, ?)"
+        )
+    else:
+        return (
+            f"INSERT INTO {INFERENCE_TABLE} (ID, TID, KEY_ID, PREDICTION) "
+            f"VALUES (sys.SEQ_ML_INFERENCE.NEXTVAL, {train_id}, ?, ?)"
+        )
+
+
+def score_task(job_id: int, train_id: int, model_path: str, req: RequestScore):
+    session = SessionFactory()
+    job = session.get(ScoreJobEntity, job_id)
+
+    # The source rows are streamed on one connection while predictions are
+    # committed on another, so commits never close the open result set.
+    src, dst = get_db_connection(), get_db_connection()
+    try:
+        job.status = "running"
+        session.commit()
+
+        model = model_cache.get(model_path)
+        insert = get_insert_prediction_sql(train_id, req)
+
+        cursor = src.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {req.table_name}")
+        (total,) = cursor.fetchone()
+        job.total = int(total)
+        session.commit()
+
+        cursor.execute(
+            f"SELECT {req.key_column_name}, {req.data_column_name} "
+            f"FROM {req.table_name}"
+        )
+        writer = dst.cursor()
+
+        start = monotonic()
+        while rows := cursor.fetchmany(req.batch_size):
+            inputs = torch.cat(
+                [
+                    decode_inference_image(blob, req.width, req.height)
+                    for _, blob in rows
+                ]
+            )
+            with torch.inference_mode():
+                outputs = model(inputs.to(model_cache.device)).cpu()
+            predictions = torch.argmax(outputs, dim=1).tolist()
+
+            writer.executemany(
+                insert, [(key, pred) for (key, _), pred in zip(rows, predictions)]
+            )
+            dst.commit()
+
+            job.processed += len(rows)
+            job.rows_per_sec = job.processed / max(monotonic() - start, 1e-6)
+            session.commit()
+
+            metrics.inc("score.rows", len(rows))
+
+        job.status = "done"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        session.commit()
+        session.close()
+        src.close()
+        dst.close()
+
+
+def _count_rows(table_name: str) -> int:
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+        (total,) = cursor.fetchone()
+        cursor.close()
+
+        return int(total)
+    finally:
+        conn.close()
+
+
+async def _score_partition(
+    kc: KernelClient,
+    session: Session,
+    partition: ScorePartitionEntity,
+    model_path: str,
+    source: str,
+    max_retries: int,
+) -> None:
+    model_filename = os.path.split(model_path)[1]
+
+    while partition.attempts <= max_retries:
+        partition.attempts += 1
+        partition.status = "running"
+        session.commit()
+
+        kernel = await kc.create_kernel()
+        if not kernel:
+            partition.error = "no providers available"
+            session.commit()
+            await asyncio.sleep(1.0)
+            continue
+
+        partition.kernel = kernel.id
+        session.commit()
+
+        try:
+            await kernel.send_file(model_path, model_filename)
+            result = await kernel.evaluate(
+                source, f"Score partition {partition.partition}"
+            )
+            partition.processed = result["rows"]
+            partition.seconds = result["seconds"]
+            partition.status = "done"
+            partition.error = None
+            session.commit()
+
+            metrics.inc("score.rows", result["rows"])
+            return
+        except Exception as e:
+            partition.error = str(e)
+        finally:
+            await kernel.clear_workspace()
+            await kernel.stop()
+
+        metrics.inc("score.partition_retry")
+        session.commit()
+
+    partition.status = "failed"
+    session.commit()
+
+
+async def distributed_score_task(
+    job_id: int,
+    train_id: int,
+    model_path: str,
+    req: RequestScore,
+    kc: KernelClient,
+):
+    """
+    Split the table by MOD(key, partitions), score every partition on its
+    own kernel and retry failed partitions up to `max_retries` times.
+    """
+    session = SessionFactory()
+    job = session.get(ScoreJobEntity, job_id)
+
+    try:
+        job.status = "running"
+        job.total = await run_in_threadpool(_count_rows, req.table_name)
+        session.commit()
+
+        partitions = []
+        for index in range(req.partitions):
+            partition = ScorePartitionEntity(
+                job_id=job_id, partition=index, status="queued"
+            )
+            session.add(partition)
+            partitions.append(partition)
+        session.commit()
+
+        insert = get_insert_prediction_sql(train_id, req)
+        start = monotonic()
+
+        await asyncio.gather(
+            *[
+                _score_partition(
+                    kc,
+                    session,
+                    partition,
+                    model_path,
+                    get_score_source(
+                        os.path.split(model_path)[1],
+                        req.table_name,
+                        req.key_column_name,
+                        req.data_column_name,
+                        insert,
+                        partition.partition,
+                        req.partitions,
+                        req.batch_size,
+                        req.width,
+                        req.height,
+                    ),
+                    req.max_retries,
+                )
+                for partition in partitions
+            ]
+        )
+
+        job.processed = sum(partition.processed for partition in partitions)
+        job.rows_per_sec = job.processed / max(monotonic() - start, 1e-6)
+
+        failed = [p.partition for p in partitions if p.status != "done"]
+        if failed:
+            job.status = "failed"
+            job.error = f"failed partitions: {failed}"
+        else:
+            job.status = "done"
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        session.commit()
+        session.close()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/model/sweep.py
+
+import asyncio
+import itertools
+import json
+import math
+import random
+import re
+from typing import Any, Dict, List, Literal, Union
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, Field, Json
+from sqlalchemy import Column, Float, Integer, String, Text
+from sqlalchemy.orm import Session
+
+from app.config.database import SessionFactory
+from app.config.kernel import KernelClient, KernelConnection
+from app.model.base_model import Base, BaseEntity
+from app.model.model import Model
+from app.model.train import RequestTrain
+from app.util.metrics import metrics
+from app.util.source_generator import (
+    get_dataloader_source,
+    get_network_source,
+    get_sweep_source,
+)
+
+SWEEP_KEYS = ["num_epochs"]  # mini_batches is not used by sweep.source yet
+SWEEP_PREFIXES = ["optimizer.", "loss_fn."]
+
+
+class SweepEntity(BaseEntity):
+    model_id: Union[int, Column] = Column(Integer, nullable=False)
+    strategy: Union[str, Column] = Column(String(50), nullable=False)
+    status: Union[str, Column] = Column(String(50), nullable=False)
+    kernels: Union[int, Column] = Column(Integer, default=0)
+    error: Union[str, Column] = Column(Text, nullable=True)
+
+
+class SweepTrialEntity(BaseEntity):
+    sweep_id: Union[int, Column] = Column(Integer, nullable=False, index=True)
+    params: Union[str, Column] = Column(Text, nullable=False)  # json
+    status: Union[str, Column] = Column(String(50), nullable=False)
+    kernel: Union[str, Column] = Column(String(36), nullable=True)
+    rung: Union[int, Column] = Column(Integer, default=0)
+    epoch: Union[int, Column] = Column(Integer, default=0)
+    accuracy: Union[float, Column] = Column(Float, nullable=True)  # best epoch
+    history: Union[str, Column] = Column(Text, default="[]")  # json, per epoch
+    error: Union[str, Column] = Column(Text, nullable=True)
+
+
+class SweepTrial(Base):
+    rank: int | None = None
+    params: Json[Dict[str, Any]]
+    status: str
+    kernel: str | None
+    rung: int
+    epoch: int
+    accuracy: float | None
+    history: Json[List[float]]
+    error: str | None
+
+
+class Sweep(Base):
+    model_id: int
+    strategy: str
+    status: str
+    kernels: int
+    error: str | None
+    trials: List[SweepTrial] = []  # ranked by accuracy
+
+    model_config = ConfigDict(protected_namespaces=())
+
+
+class RequestSweep(BaseModel):
+    # dataset/testset과 탐색하지 않는 값의 기본값
+    train: RequestTrain
+    # "num_epochs" | "optimizer.<param>" | "loss_fn.<param>"
+    # -> 후보 값 목록 (optimizer/loss_fn 값은 repr()로 params 문자열에 치환)
+    space: Dict[str, List[Any]]
+    strategy: Literal["grid", "random"] = "grid"
+    num_trials: int = Field(10, ge=1)  # random
+    seed: int | None = None
+    # 동시에 쓰는 커널 수 (클러스터 여유가 적으면 그만큼만 사용)
+    concurrency: int = Field(4, ge=1)
+    # successive halving: min_epochs * eta^k epoch마다 상위 1/eta만 계속 학습
+    halving: bool = True
+    min_epochs: int = Field(1, ge=1)
+    eta: int = Field(3, ge=2)
+
+
+def expand_space(req: RequestSweep) -> List[Dict[str, Any]]:
+    for key, values in req.space.items():
+        if key not in SWEEP_KEYS and not any(map(key.startswith, SWEEP_PREFIXES)):
+            raise HTTPException(status_code=400, detail=f"unknown sweep key: {key}")
+        elif not values:
+            raise HTTPException(status_code=400, detail=f"empty sweep values: {key}")
+
+    keys = list(req.space)
+    if req.strategy == "grid":
+        combinations = itertools.product(*req.space.values())
+    else:
+        rand = random.Random(req.seed)
+        combinations = (
+            [rand.choice(req.space[key]) for key in keys] for _ in range(req.num_trials)
+        )
+
+    return [dict(zip(keys, values)) for values in combinations]
+
+
+def override_params(params: str, overrides: Dict[str, Any]) -> str:
+    """
+    Replace keyword arguments in a component's params source, e.g.
+    override_params("{MODEL}.parameters(), lr=0.01", {"lr": 0.1}).
+    Missing keywords are appended.
+    """
+    for name, value in overrides.items():
+        pattern = rf"(?<![\w.]){re.escape(name)}\s*=\s*(\([^)]*\)|\[[^\]]*\]|[^,]+)"
+        keyword = f"{name}={value!r}"
+
+        if re.search(pattern, params):
+            params = re.sub(pattern, lambda _: keyword, params, count=1)
+        else:
+            params = f"{params}, {keyword}" if params.strip() else keyword
+
+    return params
+
+
+def apply_trial_params(model: Model, params: Dict[str, Any]) -> Model:
+    model = model.model_copy(deep=True)
+
+    for component in ["optimizer", "loss_fn"]:
+        prefix = f"{component}."
+        overrides = {
+            key[len(prefix) :]: value
+            for key, value in params.items()
+            if key.startswith(prefix)
+        }
+        if overrides:
+            target = getattr(model, component)
+            target.params = override_params(target.params, overrides)
+
+    return model
+
+
+def get_trial_epochs(req: RequestSweep, params: Dict[str, Any]) -> int:
+    return int(params.get("num_epochs", req.train.num_epochs))
+
+
+def new_sweep(model_id: int, req: RequestSweep, session: Session) -> Sweep:
+    trials = expand_space(req)
+
+    entity = SweepEntity(model_id=model_id, strategy=req.strategy, status="queued")
+    session.add(entity)
+    session.flush()
+
+    for params in trials:
+        session.add(
+            SweepTrialEntity(
+                sweep_id=entity.id, params=json.dumps(params), status="queued"
+            )
+        )
+    session.commit()
+
+    return Sweep.model_validate(entity)
+
+
+def get_sweep(model_id: int, sweep_id: int, session: Session) -> Sweep:
+    entity = session.get(SweepEntity, sweep_id)
+    if not entity or entity.model_id != model_id:
+        raise HTTPException(status_code=404, detail="sweep not found")
+
+    trials = [
+        SweepTrial.model_validate(trial)
+        for trial in session.query(SweepTrialEntity).filter(
+            SweepTrialEntity.sweep_id == sweep_id
+        )
+    ]
+    trials.sort(key=lambda trial: (trial.accuracy is None, -(trial.accuracy or 0)))
+    for rank, trial in enumerate(trials, 1):
+        trial.rank = rank if trial.accuracy is not None else None
+
+    sweep = Sweep.model_validate(entity)
+    sweep.trials = trials
+
+    return sweep
+
+
+async def _create_sweep_kernels(kc: KernelClient, size: int) -> List[KernelConnection]:
+    kernels = []
+    for _ in range(size):
+        kernel = await kc.create_kernel()
+        if not kernel:
+            break  # the cluster is full, sweep with what we got
+        kernels.append(kernel)
+
+    return kernels
+
+
+async def _prepare_kernel(
+    kernel: KernelConnection, req: RequestTrain, model: Model
+) -> None:
+    # The dataset is loaded once per kernel and shared by all its trials.
+    await kernel.execute(
+        get_dataloader_source(
+            req.dataset.table_name,
+            req.dataset.label_column_name,
+            req.dataset.data_column_name,
+            req.testset.table_name,
+            req.testset.label_column_name,
+            req.testset.data_column_name,
+            req.dataset.key_column_name,
+            req.testset.key_column_name,
+        ),
+        "Sweep: Ready dataloader",
+    )
+    await kernel.execute(get_network_source(model), "Sweep: Define network")
+
+
+async def _run_trials(
+    kernel: KernelConnection,
+    trials: List[SweepTrialEntity],
+    budget: int,
+    req: RequestSweep,
+    model: Model,
+    session: Session,
+) -> None:
+    for trial in trials:
+        params = json.loads(trial.params)
+        until = min(budget, get_trial_epochs(req, params))
+
+        try:
+            result = await kernel.evaluate(
+                get_sweep_source(apply_trial_params(model, params), trial.id, until),
+                f"Sweep trial {trial.id}",
+            )
+            trial.epoch = result["epoch"]
+            trial.history = json.dumps(result["accuracy"])
+            trial.accuracy = max(result["accuracy"], default=None)
+        except Exception as e:
+            trial.status = "failed"
+            trial.error = str(e)
+
+        session.commit()
+        metrics.inc("sweep.trial_rung")
+
+
+async def _release_trials(
+    kernels: Dict[str, KernelConnection], trials: List[SweepTrialEntity]
+) -> None:
+    for trial in trials:
+        await kernels[trial.kernel].execute(
+            f"_SWEEP.pop({trial.id}, None)", f"Sweep release {trial.id}"
+        )
+
+
+async def sweep_task(sweep_id: int, req: RequestSweep, model: Model, kc: KernelClient):
+    """
+    Run every trial of a sweep on a pool of at most `concurrency` kernels.
+
+    Trials are pinned to a kernel, which keeps their model and optimizer
+    between rungs. With `halving`, rung k trains the remaining trials up to
+    min_epochs * eta^k epochs and keeps the best 1/eta of them by their
+    latest accuracy; the others are stopped.
+    """
+    session = SessionFactory()
+    sweep = session.get(SweepEntity, sweep_id)
+    kernels: List[KernelConnection] = []
+
+    try:
+        trials = (
+            session.query(SweepTrialEntity)
+            .filter(SweepTrialEntity.sweep_id == sweep_id)
+            .order_by(SweepTrialEntity.id)
+            .all()
+        )
+
+        kernels = await _create_sweep_kernels(kc, min(req.concurrency, len(trials)))
+        if not kernels:
+            raise Exception("no providers available")
+
+        sweep.status = "running"
+        sweep.kernels = len(kernels)
+        session.commit()
+
+        await asyncio.gather(
+            *[_prepare_kernel(kernel, req.train, model) for kernel in kernels]
+        )
+
+        for index, trial in enumerate(trials):
+            trial.kernel = kernels[index % len(kernels)].id
+        session.commit()
+
+        by_id = {kernel.id: kernel for kernel in kernels}
+        running = trials
+        rung = 0
+        while running:
+            budget = req.min_epochs * req.eta**rung if req.halving else math.inf
+            for trial in running:
+                trial.rung = rung
+                trial.status = "running"
+            session.commit()
+
+            await asyncio.gather(
+                *[
+                    _run_trials(
+                        kernel,
+                        [trial for trial in running if trial.kernel == kernel.id],
+                        budget,
+                        req,
+                        model,
+                        session,
+                    )
+                    for kernel in kernels
+                ]
+            )
+
+            finished = []
+            for trial in running:
+                if trial.status == "running" and trial.epoch >= get_trial_epochs(
+                    req, json.loads(trial.params)
+                ):
+                    trial.status = "done"
+                if trial.status != "running":
+                    finished.append(trial)
+
+            running = [trial for trial in running if trial.status == "running"]
+            if running:
+                running.sort(key=lambda trial: -json.loads(trial.history)[-1])
+                keep = max(math.ceil(len(running) / req.eta), 1)
+                for trial in running[keep:]:
+                    trial.status = "stopped"
+                    metrics.inc("sweep.trial_stopped")
+                finished.extend(running[keep:])
+                running = running[:keep]
+
+            session.commit()
+            await _release_trials(by_id, finished)
+            rung += 1
+
+        sweep.status = "done"
+    except Exception as e:
+        sweep.status = "failed"
+        sweep.error = str(e)
+    finally:
+        session.commit()
+        session.close()
+        for kernel in kernels:
+            await kernel.stop()
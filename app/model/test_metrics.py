@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/model/test_metrics.py
+
+import hashlib
+import json
+import math
+import os
+from typing import Any, Dict, List, Set, Tuple, Union
+
+from fastapi import HTTPException
+from jaydebeapi import Connection, DatabaseError
+from sqlalchemy import Column, String, Text
+from sqlalchemy.orm import Session
+
+from app.model.base_model import BaseEntity
+from app.model.train import RequestTable
+from app.util.lru_cache import LRUCache
+from kernel.kernel_dataset import read_blob
+
+# (path, mtime_ns, size) -> sha256, so an artifact is hashed once
+_digests: LRUCache[str] = LRUCache(256)
+
+
+class TestMetricsResultEntity(BaseEntity):
+    digest: Union[str, Column] = Column(String(64), nullable=False, index=True)
+    table_name: Union[str, Column] = Column(String(255), nullable=False)
+    columns: Union[str, Column] = Column(String(255), nullable=False)
+    version: Union[str, Column] = Column(String(255), nullable=False)
+    result: Union[str, Column] = Column(Text, nullable=False)  # json
+
+
+def get_artifact_digest(path: str) -> str:
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+
+    digest = _digests.get(key)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(1024 * 1024):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        _digests.put(key, digest)
+
+    return digest
+
+
+def get_table_version(req: RequestTable, db: Connection) -> str:
+    """
+    Row count and max key of the test table; any insert or delete changes
+    it. Updates in place do not, pass an explicit version for those.
+    """
+    key = req.key_column_name or "ROWID"
+    select = "ROWIDTOCHAR(MAX(ROWID))" if key == "ROWID" else f"MAX({key})"
+
+    cursor = db.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT(*), {select} FROM {req.table_name}")
+        count, max_key = cursor.fetchone()
+    except DatabaseError as e:
+        raise HTTPException(status_code=400, detail=f"test table not readable: {e}")
+    finally:
+        cursor.close()
+
+    return f"{int(count)}:{max_key}"
+
+
+def _get_columns(req: RequestTable) -> str:
+    return "|".join(
+        [req.label_column_name, req.data_column_name, req.key_column_name or ""]
+    ).upper()
+
+
+def get_cached_test_metrics(
+    digest: str, req: RequestTable, version: str, session: Session
+) -> Dict | None:
+    entity = (
+        session.query(TestMetricsResultEntity)
+        .filter(
+            TestMetricsResultEntity.digest == digest,
+            TestMetricsResultEntity.table_name == req.table_name.upper(),
+            TestMetricsResultEntity.columns == _get_columns(req),
+            TestMetricsResultEntity.version == version,
+        )
+        .order_by(TestMetricsResultEntity.id.desc())
+        .first()
+    )
+
+    return json.loads(entity.result) if entity else None
+
+
+def save_test_metrics(
+    digest: str, req: RequestTable, version: str, result: Dict, session: Session
+) -> None:
+    # Only the latest table version is kept per model and table.
+    session.query(TestMetricsResultEntity).filter(
+        TestMetricsResultEntity.digest == digest,
+        TestMetricsResultEntity.table_name == req.table_name.upper(),
+        TestMetricsResultEntity.columns == _get_columns(req),
+    ).delete()
+
+    session.add(
+        TestMetricsResultEntity(
+            digest=digest,
+            table_name=req.table_name.upper(),
+            columns=_get_columns(req),
+            version=version,
+            result=json.dumps(result),
+        )
+    )
+    session.commit()
+
+
+class StratifiedSampler(object):
+    """
+    Draws random rows of a table with each label in proportion to its share
+    of the table. Sampling happens in the DB (SAMPLE clause), so only the
+    drawn rows are transferred; rows drawn before are skipped, so repeated
+    draws sample without replacement.
+    """
+
+    table: str
+    label_column: str
+    data_column: str
+    counts: Dict[Any, int]  # label -> rows in the table
+    population: int
+    drawn: Dict[Any, int]
+
+    _conn: Connection
+    _seen: Set[str]  # ROWIDs
+
+    def __init__(
+        self, conn: Connection, table: str, label_column: str, data_column: str
+    ) -> None:
+        self.table = table
+        self.label_column = label_column
+        self.data_column = data_column
+
+        self._conn = conn
+        self._seen = set()
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"SELECT {label_column}, COUNT(*) FROM {table} GROUP BY {label_column}"
+            )
+            self.counts = {label: int(count) for label, count in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+        self.population = sum(self.counts.values())
+        self.drawn = {label: 0 for label in self.counts}
+
+    def _query(self, quota: int, count: int) -> str:
+        columns = f"ROWIDTOCHAR(ROWID), {self.label_column}, {self.data_column}"
+        # Over-sample a little: SAMPLE returns about `percent` of the rows.
+        percent = 100 * 1.5 * quota / count
+        sample = f"SAMPLE ({max(percent, 1e-6):f}) " if percent < 100 else ""
+        # SAMPLE keeps scan order and draw() takes the first rows, so shuffle
+        # them; otherwise rows late in the table would be under-sampled.
+        return (
+            f"SELECT {columns} FROM {self.table} {sample}"
+            f"WHERE {self.label_column} = ? ORDER BY DBMS_RANDOM.VALUE"
+        )
+
+    def draw(self, size: int) -> Tuple[List[Any], List[Any]]:
+        """
+        About `size` new (labels, blobs); fewer once the table runs out.
+        """
+        labels, blobs = [], []
+
+        cursor = self._conn.cursor()
+        try:
+            for label, count in self.counts.items():
+                left = count - self.drawn[label]
+                quota = min(math.ceil(size * count / self.population), left)
+                if quota <= 0:
+                    continue
+
+                cursor.execute(self._query(quota + self.drawn[label], count), (label,))
+                taken = 0
+                while taken < quota and (records := cursor.fetchmany(quota)):
+                    for rowid, row_label, blob in records:
+                        if taken < quota and rowid not in self._seen:
+                            self._seen.add(rowid)
+                            labels.append(row_label)
+                            blobs.append(read_blob(blob))
+                            taken += 1
+
+                self.drawn[label] += taken
+        finally:
+            cursor.close()
+
+        return labels, blobs
+
+    @property
+    def exhausted(self) -> bool:
+        return all(self.drawn[label] >= count for label, count in self.counts.items())
@@ -4,19 +4,27 @@
 
 import io
 from datetime import datetime
+from typing import Literal
 
 import torchvision.transforms as transforms
 from fastapi import HTTPException
 from jaydebeapi import Connection, DatabaseError
 from PIL import Image
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from torch import Tensor
 
+from app.config.settings import get
+from app.util.lru_cache import LRUCache
+
+settings = get()
+
 
 class RequestTable(BaseModel):
     table_name: str
     label_column_name: str
     data_column_name: str
+    # append-only 테이블의 증분 캐시 기준 컬럼 (없으면 ROWID 사용)
+    key_column_name: str | None = None
 
 
 class RequestTrain(BaseModel):
@@ -24,6 +32,29 @@ class RequestTrain(BaseModel):
     mini_batches: int
     dataset: RequestTable
     testset: RequestTable
+    # 학습 후 추가로 생성할 int8 모델 (dynamic: Linear/LSTM, static: FX + 보정)
+    quantize: Literal["dynamic", "static"] | None = None
+    calibration_batches: int = 10
+    # > 1: 커널 world_size개로 DDP(gloo) 학습, dataset.key_column_name(숫자) 필요
+    world_size: int = Field(1, ge=1)
+    # N epoch마다 체크포인트 저장 (0: 저장하지 않음)
+    checkpoint_every: int = Field(1, ge=0)
+    # bf16 autocast (bf16 지원 CPU에서 빨라짐), torch.compile (CPU: inductor)
+    autocast: bool = False
+    compile: bool = False
+    # 학습 전 batch_size x num_workers 조합을 측정해 가장 빠른 DataLoader 설정 사용
+    # (모델/테이블별로 provider 캐시에 저장)
+    autotune: bool = False
+    # step별 data/h2d/forward/backward/optimizer/log 시간을 epoch마다 로그로 남김
+    profile: bool = False
+    # > 0: trace_start step부터 trace_steps step을 torch.profiler로 기록 ("trace" artifact)
+    trace_start: int = Field(10, ge=0)
+    trace_steps: int = Field(0, ge=0)
+    # 이어서 학습: parent train의 모델에서 시작해 parent 이후 추가된 행만 학습
+    # (dataset.key_column_name(숫자) 필요, ROWID는 rank 간 비교 불가)
+    parent_id: int | None = None
+    # parent 이전 행을 새 행 수 x replay 만큼 무작위로 섞어 학습 (망각 방지)
+    replay: float = Field(0.0, ge=0)
 
 
 class Train(BaseModel):
@@ -56,7 +87,12 @@ class TrainView(BaseModel):
         )
 
 
-def new_train(mode_id: int, db: Connection) -> Train:
+def new_train(
+    mode_id: int,
+    db: Connection,
+    params: str | None = None,
+    parent_id: int | None = None,
+) -> Train:
     status = "request train"
     try:
         cursor = db.cursor()
@@ -65,8 +101,9 @@ def new_train(mode_id: int, db: Connection) -> Train:
         (train_id,) = cursor.fetchone()
 
         cursor.execute(
-            "INSERT INTO sys.ML_TRAIN (ID, MID, STATUS) VALUES "
-            f"({train_id}, {mode_id}, '{status}');"
+            "INSERT INTO sys.ML_TRAIN (ID, MID, STATUS, PARAMS, PARENT) VALUES "
+            f"({train_id}, {mode_id}, '{status}', ?, ?);",
+            (params, parent_id),
         )
 
         cursor.execute(f"SELECT * FROM sys.ML_TRAIN WHERE ID = {train_id}")
@@ -84,23 +121,171 @@ def new_train(mode_id: int, db: Connection) -> Train:
         cursor.close()
 
 
-def get_train_by_id(id: int, db: Connection) -> Train:
+_train_cache: LRUCache[Train] = LRUCache(
+    settings.model_cache_size, settings.model_cache_ttl
+)
+
+
+def get_train_by_id(id: int, db: Connection, cached: bool = False) -> Train:
+    if cached and (train := _train_cache.get(id)):
+        return train
+
     try:
         cursor = db.cursor()
 
-        cursor.execute(f"SELECT * FROM sys.ML_TRAIN WHERE ID = {id}")
+        cursor.execute(
+            f"SELECT ID, MID, KERNEL, STATUS, PATH FROM sys.ML_TRAIN WHERE ID = {id}"
+        )
         result = cursor.fetchone()
 
         if not result:
             raise HTTPException(status_code=404, detail="train info not found")
 
-        return Train(*result)
+        train = Train(*result)
+        # Only finished trains are cached: their artifact path is final.
+        if train.path:
+            _train_cache.put(id, train)
+
+        return train
     except DatabaseError as e:
         raise HTTPException(status_code=404, detail=f"train info not found: {e}")
     finally:
         cursor.close()
 
 
+def get_train_params(id: int, db: Connection) -> RequestTrain:
+    try:
+        cursor = db.cursor()
+
+        cursor.execute(f"SELECT PARAMS FROM sys.ML_TRAIN WHERE ID = {id}")
+        result = cursor.fetchone()
+
+        if not result:
+            raise HTTPException(status_code=404, detail="train info not found")
+        elif not result[0]:
+            raise HTTPException(status_code=409, detail="train params not recorded")
+
+        return RequestTrain.model_validate_json(result[0])
+    except DatabaseError as e:
+        raise HTTPException(status_code=404, detail=f"train info not found: {e}")
+    finally:
+        cursor.close()
+
+
+def get_train_hwm(id: int, db: Connection) -> str | None:
+    try:
+        cursor = db.cursor()
+
+        cursor.execute(f"SELECT HWM FROM sys.ML_TRAIN WHERE ID = {id}")
+        result = cursor.fetchone()
+
+        if not result:
+            raise HTTPException(status_code=404, detail="train info not found")
+
+        return result[0]
+    except DatabaseError as e:
+        raise HTTPException(status_code=404, detail=f"train info not found: {e}")
+    finally:
+        cursor.close()
+
+
+def get_train_artifact_path(train: Train, variant: str, db: Connection) -> str:
+    if variant == "default":
+        if not train.path:
+            raise HTTPException(status_code=503, detail="unprepared trained model")
+        return train.path
+
+    try:
+        cursor = db.cursor()
+
+        cursor.execute(
+            "SELECT PATH FROM sys.ML_TRAIN_ARTIFACT WHERE TID = ? AND NAME = ?",
+            (train.id, variant),
+        )
+        result = cursor.fetchone()
+
+        if not result:
+            raise HTTPException(status_code=404, detail="train artifact not found")
+
+        return result[0]
+    except DatabaseError as e:
+        raise HTTPException(status_code=404, detail=f"train artifact not found: {e}")
+    finally:
+        cursor.close()
+
+
+def get_parent_model_path(parent: Train, db: Connection) -> str:
+    # The exported model of a finished train, else its latest checkpoint.
+    if parent.path:
+        return parent.path
+
+    return get_train_artifact_path(parent, "checkpoint", db)
+
+
+def format_test_metrics(result: dict) -> str:
+    def number(value):
+        return "nan" if value is None else "%.2f" % value
+
+    classes = result["classes"]
+    report = [
+        "%5s %9s %9s %9s %9s" % ("", "precision", "recall", "f1-score", "support")
+    ]
+    for i, support in enumerate(classes["support"]):
+        report.append(
+            "%5d %9s %9s %9s %9d"
+            % (
+                i,
+                number(classes["precision"][i]),
+                number(classes["recall"][i]),
+                number(classes["f1"][i]),
+                support,
+            )
+        )
+
+    # sample mode: "value [lo, hi]" at the sample's confidence
+    intervals = result.get("sample", {}).get("intervals", {})
+
+    def estimate(name, suffix=""):
+        interval = intervals.get(name)
+        if interval is None:
+            return number(result[name]) + suffix
+        return "%s%s [%s, %s]" % (
+            number(result[name]),
+            suffix,
+            number(interval[0]),
+            number(interval[1]),
+        )
+
+    sample = []
+    if "sample" in result:
+        sample.append(
+            "Sample: %d of %d rows, %d rounds, %d%% confidence"
+            % (
+                result["sample"]["rows"],
+                result["sample"]["population"],
+                result["sample"]["rounds"],
+                round(100 * result["sample"]["confidence"]),
+            )
+        )
+
+    return "\n".join(
+        [
+            *sample,
+            "Accuracy: %s" % estimate("accuracy", "%"),
+            "F1-score: %s" % estimate("f1"),
+            "Precision: %s" % estimate("precision"),
+            "Recall: %s" % estimate("recall"),
+            "Confusion Matrix:",
+            *(
+                " ".join("%5d" % count for count in row)
+                for row in result["confusion_matrix"]
+            ),
+            "Classification Report:",
+            *report,
+        ]
+    )
+
+
 class RequestData(BaseModel):
     table_name: str
     data_column_name: str
@@ -113,6 +298,17 @@ class RequestInferenceImage(BaseModel):
     # TODO: 모델 정보를 바탕으로 width, height 추출하는 방법 리서치
     width: int = 32
     height: int = 32
+    # default | frozen | int8
+    variant: str = "default"
+
+
+def decode_inference_image(blob, width: int, height: int) -> Tensor:
+    image = Image.open(io.BytesIO(bytes(blob.getBytes(1, int(blob.length())))))
+    transform = transforms.Compose(
+        [transforms.Resize((width, height)), transforms.ToTensor()]
+    )
+
+    return transform(image).unsqueeze(0)
 
 
 def get_inference_image_from_db(req: RequestInferenceImage, db: Connection) -> Tensor:
@@ -131,12 +327,8 @@ def get_inference_image_from_db(req: RequestInferenceImage, db: Connection) -> T
             )
 
         (blob,) = result
-        image = Image.open(io.BytesIO(bytes(blob.getBytes(1, int(blob.length())))))
-        transform = transforms.Compose(
-            [transforms.Resize((req.width, req.height)), transforms.ToTensor()]
-        )
 
-        return transform(image).unsqueeze(0)
+        return decode_inference_image(blob, req.width, req.height)
     except DatabaseError as e:
         raise HTTPException(
             status_code=404, detail=f"inference input data not found: {e}"
@@ -145,35 +337,59 @@ def get_inference_image_from_db(req: RequestInferenceImage, db: Connection) -> T
         cursor.close()
 
 
-class TrainLog(BaseModel):
-    tid: int
+class TrainLogView(BaseModel):
+    seq: int | None
     log: str
     create_at: datetime
 
-    def __init__(self, tid, log, create_at) -> None:
-        super().__init__(tid=tid, log=log, create_at=create_at)
 
+def _parse_log_cursor(since: str) -> tuple[str, str | int]:
+    if since.isdigit():
+        return "SEQ > ?", int(since)
 
-class TrainLogView(BaseModel):
-    log: str
-    create_at: datetime
+    try:
+        timestamp = datetime.fromisoformat(since)
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="since must be a sequence or an ISO timestamp"
+        )
 
+    return (
+        "CREATEDAT > TO_TIMESTAMP(?, 'YYYY-MM-DD HH24:MI:SS.FF6')",
+        timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
+    )
+
+
+def get_train_log_by_id(
+    train_id: int,
+    db: Connection,
+    since: str | None = None,
+    limit: int | None = None,
+) -> list[dict]:
+    # Rows are returned as plain dicts: polling clients call this every few
+    # seconds, so the rows skip pydantic validation.
+    query = "SELECT SEQ, LOG, CREATEDAT FROM sys.ML_TRAIN_LOG WHERE TID = ?"
+    params = [train_id]
+
+    if since:
+        condition, value = _parse_log_cursor(since)
+        query += f" AND {condition}"
+        params.append(value)
+
+    query += " ORDER BY SEQ, CREATEDAT"
+    if limit:
+        query = f"SELECT * FROM ({query}) WHERE ROWNUM <= ?"
+        params.append(limit)
 
-def get_train_log_by_id(train_id: int, db: Connection) -> list[TrainLog]:
     try:
         cursor = db.cursor()
 
-        cursor.execute(
-            f"SELECT * FROM sys.ML_TRAIN_LOG WHERE TID = {train_id} ORDER BY CREATEDAT"
-        )
-        result = cursor.fetchall()
-
-        if not result:
-            raise HTTPException(status_code=404, detail="train info not found")
-
-        result = [TrainLog(*row) for row in result]
+        cursor.execute(query, params)
 
-        return result
+        return [
+            {"seq": None if seq is None else int(seq), "log": log, "create_at": at}
+            for seq, log, at in cursor.fetchall()
+        ]
     except DatabaseError as e:
         raise HTTPException(status_code=404, detail=f"train info not found: {e}")
     finally:
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/model/train_metric.py
+
+import math
+from datetime import datetime
+from typing import Dict, List, Literal, Union
+
+from pydantic import BaseModel
+from sqlalchemy import Column, Float, Integer, String, func, insert
+from sqlalchemy.orm import Session
+
+from app.config.database import SessionFactory
+from app.model.base_model import BaseEntity
+from app.util.metrics import metrics
+
+METRIC_FIELDS = ["step", "epoch", "loss", "accuracy", "samples_per_sec", "time"]
+
+
+class TrainMetricEntity(BaseEntity):
+    train_id: Union[int, Column] = Column(Integer, nullable=False, index=True)
+    kind: Union[str, Column] = Column(String(10), nullable=False)  # step | epoch
+    step: Union[int, Column] = Column(Integer, nullable=False)
+    epoch: Union[int, Column] = Column(Integer, nullable=False)
+    loss: Union[float, Column] = Column(Float, nullable=True)
+    accuracy: Union[float, Column] = Column(Float, nullable=True)
+    samples_per_sec: Union[float, Column] = Column(Float, nullable=True)
+    time: Union[float, Column] = Column(Float, nullable=False)  # kernel clock
+
+
+class TrainMetricPoint(BaseModel):
+    step: int
+    epoch: int
+    loss: float | None
+    accuracy: float | None
+    samples_per_sec: float | None
+    time: float
+
+
+class TrainMetricSeries(BaseModel):
+    train_id: int
+    kind: str
+    total: int  # records stored
+    bucket: int  # steps averaged into one point
+    points: List[TrainMetricPoint]
+
+
+def save_train_metrics(train_id: int, records: List[Dict]) -> None:
+    """
+    Store one TRAIN_METRICS batch of a kernel in a single transaction. A
+    resumed train reports the steps after its checkpoint again; their
+    records replace the earlier ones.
+    """
+    now = datetime.now()
+    rows = [
+        {
+            "train_id": train_id,
+            "kind": record.get("kind", "step"),
+            **{field: record.get(field) for field in METRIC_FIELDS},
+            "created_at": now,
+            "updated_at": now,
+        }
+        for record in records
+    ]
+
+    steps: Dict[str, List[int]] = {}
+    for row in rows:
+        steps.setdefault(row["kind"], []).append(row["step"])
+
+    session = SessionFactory()
+    try:
+        for kind, kind_steps in steps.items():
+            session.query(TrainMetricEntity).filter(
+                TrainMetricEntity.train_id == train_id,
+                TrainMetricEntity.kind == kind,
+                TrainMetricEntity.step.in_(kind_steps),
+            ).delete(synchronize_session=False)
+        session.execute(insert(TrainMetricEntity), rows)
+        session.commit()
+    finally:
+        session.close()
+
+    metrics.inc("train.metric_records", len(rows))
+
+
+def get_train_metrics(
+    train_id: int,
+    session: Session,
+    kind: Literal["step", "epoch"] = "step",
+    points: int = 500,
+) -> TrainMetricSeries:
+    """
+    Return the `kind` records of a train as at most `points` points. Records
+    are grouped into equal step ranges; a point is the mean of its range,
+    with the last step, epoch and time of the range.
+    """
+    filters = [TrainMetricEntity.train_id == train_id, TrainMetricEntity.kind == kind]
+    total, first, last = (
+        session.query(
+            func.count(TrainMetricEntity.id),
+            func.min(TrainMetricEntity.step),
+            func.max(TrainMetricEntity.step),
+        )
+        .filter(*filters)
+        .one()
+    )
+
+    if not total:
+        return TrainMetricSeries(
+            train_id=train_id, kind=kind, total=0, bucket=1, points=[]
+        )
+
+    bucket = max(math.ceil((last - first + 1) / points), 1)
+    rows = (
+        session.query(
+            func.max(TrainMetricEntity.step),
+            func.max(TrainMetricEntity.epoch),
+            func.avg(TrainMetricEntity.loss),
+            func.avg(TrainMetricEntity.accuracy),
+            func.avg(TrainMetricEntity.samples_per_sec),
+            func.max(TrainMetricEntity.time),
+        )
+        .filter(*filters)
+        .group_by((TrainMetricEntity.step - first) // bucket)
+        .order_by(func.max(TrainMetricEntity.step))
+        .all()
+    )
+
+    return TrainMetricSeries(
+        train_id=train_id,
+        kind=kind,
+        total=total,
+        bucket=bucket,
+        points=[TrainMetricPoint(**dict(zip(METRIC_FIELDS, row))) for row in rows],
+    )
@@ -1,4 +1,5 @@
 from .kernel_router import router as kernel
+from .metrics_router import router as metrics
 from .model_router import router as model
 from .setting_router import router as setting
 from .train_router import router as train
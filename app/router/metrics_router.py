@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/routes/metrics_router.py
+
+from fastapi import APIRouter
+
+from app.util.metrics import metrics
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/")
+def get_metrics():
+    return metrics.dump()
@@ -2,16 +2,39 @@
 # -*- coding: utf-8 -*-
 # app/routes/model_router.py
 
+import os
 from io import StringIO
+from typing import Literal
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Request,
+)
 from fastapi.responses import PlainTextResponse, StreamingResponse
 from jaydebeapi import Connection
+from sqlalchemy.orm import Session
 
-from app.config.kernel import KernelClient, KernelConnection, get_client
+from app.config.database import get_session
+from app.config.kernel import KernelClient, get_client
+from app.config.scheduler import JobDispatcher, get_dispatcher
 from app.config.tibero import get_db
-from app.model.model import Model, get_model_from_db
-from app.model.train import RequestTrain, Train, new_train
+from app.model.job import has_active_train_job, new_train_job
+from app.model.model import Model, get_model_etag, get_model_from_db
+from app.model.sweep import RequestSweep, Sweep, get_sweep, new_sweep, sweep_task
+from app.model.train import (
+    RequestTable,
+    RequestTrain,
+    get_parent_model_path,
+    get_train_artifact_path,
+    get_train_by_id,
+    get_train_hwm,
+    get_train_params,
+    new_train,
+)
 from app.util.source_generator import (
     get_dataloader_source,
     get_network_source,
@@ -26,66 +49,158 @@ def get_model(model_id: int, db: Connection = Depends(get_db)):
     return get_model_from_db(model_id, db)
 
 
-async def train_task(
-    req: RequestTrain, model: Model, train: Train, kernel: KernelConnection
-):
-    await kernel.execute(f"_SERVER.train_id = {train.id}", "Step 1: Set train id")
-    await kernel.execute(
-        get_dataloader_source(
-            req.dataset.table_name,
-            req.dataset.label_column_name,
-            req.dataset.data_column_name,
-            req.testset.table_name,
-            req.testset.label_column_name,
-            req.testset.data_column_name,
-        ),
-        "Step 2: Ready dataloader",
-    )
-    await kernel.execute(
-        get_network_source(model),
-        "Step 3: Define network",
-    )
-    await kernel.execute(
-        get_train_source(model, train.id, req.num_epochs, req.mini_batches),
-        "Step 4: Train model",
-    )
-    await kernel.stop()
+def check_parent_train(model_id: int, req: RequestTrain, db: Connection) -> None:
+    parent = get_train_by_id(req.parent_id, db)
+    if parent.mid != model_id:
+        raise HTTPException(status_code=400, detail="parent train is of another model")
+
+    def source(table: RequestTable):
+        return table.table_name.upper(), (table.key_column_name or "").upper()
+
+    # The high-water mark is a key of the parent's dataset table.
+    if source(get_train_params(parent.id, db).dataset) != source(req.dataset):
+        raise HTTPException(
+            status_code=400, detail="parent train used another dataset table or key"
+        )
+    elif get_train_hwm(parent.id, db) is None:
+        raise HTTPException(
+            status_code=409, detail="parent train has not loaded its dataset"
+        )
+
+    if not os.path.exists(get_parent_model_path(parent, db)):
+        raise HTTPException(
+            status_code=404, detail="parent model cannot be found in the server"
+        )
 
 
 @router.post("/{model_id}/train", response_class=PlainTextResponse)
 async def train_model(
     model_id: int,
     req: RequestTrain,
+    priority: int = 0,
+    x_tenant: str = Header("default"),
+    db: Connection = Depends(get_db),
+    session: Session = Depends(get_session),
+    jd: JobDispatcher = Depends(get_dispatcher),
+):
+    if req.world_size > 1 and not req.dataset.key_column_name:
+        raise HTTPException(
+            status_code=400, detail="distributed training needs a dataset key column"
+        )
+    if req.parent_id is not None and not req.dataset.key_column_name:
+        # The ranks' hwms are compared in Python, where ROWIDs sort as text.
+        raise HTTPException(
+            status_code=400, detail="fine-tuning needs a dataset key column"
+        )
+
+    get_model_from_db(model_id, db)
+    if req.parent_id is not None:
+        check_parent_train(model_id, req, db)
+    train = new_train(model_id, db, req.model_dump_json(), req.parent_id)
+
+    new_train_job(model_id, train.id, req, x_tenant, priority, session)
+    jd.notify()
+
+    return str(train.id)
+
+
+@router.post("/{model_id}/train/{train_id}/resume", response_class=PlainTextResponse)
+async def resume_train_model(
+    model_id: int,
+    train_id: int,
+    priority: int = 0,
+    x_tenant: str = Header("default"),
+    db: Connection = Depends(get_db),
+    session: Session = Depends(get_session),
+    jd: JobDispatcher = Depends(get_dispatcher),
+):
+    """
+    Continue a failed train from its latest checkpoint, with the parameters
+    it was requested with, on any available provider.
+    """
+    train = get_train_by_id(train_id, db)
+    if train.mid != model_id:
+        raise HTTPException(status_code=404, detail="train info not found")
+    elif train.status.strip() == "done":
+        raise HTTPException(status_code=409, detail="train is already done")
+    elif has_active_train_job(train_id, session):
+        raise HTTPException(status_code=409, detail="train is queued or running")
+
+    req = get_train_params(train_id, db)
+    resume_path = get_train_artifact_path(train, "checkpoint", db)
+    if not os.path.exists(resume_path):
+        raise HTTPException(
+            status_code=404, detail="checkpoint cannot be found in the server"
+        )
+
+    new_train_job(model_id, train_id, req, x_tenant, priority, session, resume=True)
+    jd.notify()
+
+    return str(train.id)
+
+
+@router.post("/{model_id}/sweep", response_class=PlainTextResponse)
+def sweep_model(
+    model_id: int,
+    req: RequestSweep,
     background_tasks: BackgroundTasks,
     db: Connection = Depends(get_db),
+    session: Session = Depends(get_session),
     kc: KernelClient = Depends(get_client),
 ):
     model = get_model_from_db(model_id, db)
-    kernel = await kc.create_kernel()
-    if not kernel:
-        raise HTTPException(status_code=503, detail="no providers available")
-    train = new_train(model_id, db)
+    sweep = new_sweep(model_id, req, session)
 
-    background_tasks.add_task(train_task, req, model, train, kernel)
+    background_tasks.add_task(sweep_task, sweep.id, req, model, kc)
 
-    return str(train.id)
+    return str(sweep.id)
+
+
+@router.get("/{model_id}/sweep/{sweep_id}", response_model=Sweep)
+def get_sweep_report(
+    model_id: int,
+    sweep_id: int,
+    session: Session = Depends(get_session),
+):
+    return get_sweep(model_id, sweep_id, session)
+
+
+def get_source_etag(model_id: int, request: Request) -> str | None:
+    return get_model_etag(model_id, request.url.path, str(request.query_params))
+
+
+def check_source_etag(model_id: int, request: Request) -> None:
+    # Route-level dependencies are solved before `get_db`, so a matching
+    # ETag is answered without opening a DB connection.
+    etag = get_source_etag(model_id, request)
+    if not etag:
+        return
 
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        raise HTTPException(status_code=304, headers={"ETag": etag})
 
-def generate_source_response(source: str, filename: str) -> StreamingResponse:
+
+def generate_source_response(
+    source: str, filename: str, etag: str | None = None
+) -> StreamingResponse:
     vfile = StringIO()
 
     vfile.write(source)
 
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if etag:
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "no-cache"
+
     return StreamingResponse(
         iter([vfile.getvalue()]),
         media_type="text/plain",
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}",
-        },
+        headers=headers,
     )
 
 
-@router.get("/{model_id}/source/dataloader")
+@router.get("/{model_id}/source/dataloader", dependencies=[Depends(check_source_etag)])
 async def generate_dataloader_source(
     model_id: int,
     dataset_table: str,
@@ -94,6 +209,9 @@ async def generate_dataloader_source(
     testset_table: str,
     testset_label: str,
     testset_data: str,
+    request: Request,
+    dataset_key: str | None = None,
+    testset_key: str | None = None,
     db: Connection = Depends(get_db),
 ):
     model = get_model_from_db(model_id, db)
@@ -106,31 +224,63 @@ async def generate_dataloader_source(
             testset_table,
             testset_label,
             testset_data,
+            dataset_key,
+            testset_key,
         ),
         f"{model.id}_{model.name}_dataloader_source.py",
+        get_source_etag(model_id, request),
     )
 
 
-@router.get("/{model_id}/source/network")
-async def generate_network_source(model_id: int, db: Connection = Depends(get_db)):
+@router.get("/{model_id}/source/network", dependencies=[Depends(check_source_etag)])
+async def generate_network_source(
+    model_id: int, request: Request, db: Connection = Depends(get_db)
+):
     model = get_model_from_db(model_id, db)
 
     return generate_source_response(
-        get_network_source(model), f"{model.id}_{model.name}_network_source.py"
+        get_network_source(model),
+        f"{model.id}_{model.name}_network_source.py",
+        get_source_etag(model_id, request),
     )
 
 
-@router.get("/{model_id}/source/train")
+@router.get("/{model_id}/source/train", dependencies=[Depends(check_source_etag)])
 async def generate_train_source(
     model_id: int,
     train_id: int,
     num_epochs: int,
     mini_batches: int,
+    request: Request,
+    quantize: Literal["dynamic", "static"] | None = None,
+    calibration_batches: int = 10,
+    checkpoint_every: int = 1,
+    autocast: bool = False,
+    compile: bool = False,
+    autotune: bool = False,
+    profile: bool = False,
+    trace_start: int = 10,
+    trace_steps: int = 0,
     db: Connection = Depends(get_db),
 ):
     model = get_model_from_db(model_id, db)
 
     return generate_source_response(
-        get_train_source(model, train_id, num_epochs, mini_batches),
+        get_train_source(
+            model,
+            train_id,
+            num_epochs,
+            mini_batches,
+            quantize,
+            calibration_batches,
+            checkpoint_every,
+            autocast=autocast,
+            compile=compile,
+            autotune=autotune,
+            profile=profile,
+            trace_start=trace_start,
+            trace_steps=trace_steps,
+        ),
         f"{model.id}_{model.name}_train_source.py",
+        get_source_etag(model_id, request),
     )
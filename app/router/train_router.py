@@ -3,25 +3,56 @@
 # app/routes/train_router.py
 
 import os
+from concurrent.futures.process import BrokenProcessPool
+from time import monotonic
+from typing import Literal
 
 import torch
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import PlainTextResponse
+from anyio import sleep
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from jaydebeapi import Connection
+from sqlalchemy.orm import Session
 
-from app.config.kernel import KernelClient, get_client
+from app.config.database import get_session
+from app.config.evaluation import EvaluationPool, get_evaluation_pool
+from app.config.inference import InferenceEngine, get_engine
+from app.config.kernel import ExecutionError, KernelClient, get_client
+from app.config.settings import get
 from app.config.tibero import get_db
+from app.model.job import TrainJob, get_train_job
+from app.model.score import (
+    RequestScore,
+    ScoreJob,
+    distributed_score_task,
+    get_score_job,
+    new_score_job,
+    score_task,
+)
 from app.model.train import (
     RequestInferenceImage,
     RequestTable,
     TrainLogView,
     TrainView,
+    format_test_metrics,
     get_inference_image_from_db,
+    get_train_artifact_path,
     get_train_by_id,
     get_train_log_by_id,
 )
+from app.model.test_metrics import (
+    get_artifact_digest,
+    get_cached_test_metrics,
+    get_table_version,
+    save_test_metrics,
+)
+from app.model.train_metric import TrainMetricSeries, get_train_metrics
+from app.util.metrics import metrics
 from app.util.source_generator import get_test_metrics_source
 
+settings = get()
+
 router = APIRouter(prefix="/train", tags=["Train"])
 
 
@@ -35,43 +66,60 @@ def get_train_info(
     return TrainView(**train.model_dump())
 
 
+@router.get("/{train_id}/job", response_model=TrainJob)
+def get_train_job_info(
+    train_id: int,
+    session: Session = Depends(get_session),
+):
+    return get_train_job(train_id, session)
+
+
 @router.post("/{train_id}/inference-image", response_class=PlainTextResponse)
-def inference_image(
+async def inference_image(
     train_id: int,
     req: RequestInferenceImage,
     db: Connection = Depends(get_db),
+    engine: InferenceEngine = Depends(get_engine),
 ):
-    train = get_train_by_id(train_id, db)
-    if not train.path:
-        raise HTTPException(status_code=503, detail="unprepared trained model")
-    elif not os.path.exists(train.path):
+    train = await run_in_threadpool(get_train_by_id, train_id, db, True)
+    path = await run_in_threadpool(get_train_artifact_path, train, req.variant, db)
+    if not os.path.exists(path):
         raise HTTPException(
             status_code=404, detail="trained model cannot be found in the server"
         )
 
-    input = get_inference_image_from_db(req, db)
-    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    input = await run_in_threadpool(get_inference_image_from_db, req, db)
+    output = await engine.infer(path, input)
 
-    model = torch.jit.load(train.path)
-    model.to(device)
-    input = input.to(device)
+    return str(torch.argmax(output, dim=1).numpy()[0])
 
-    with torch.no_grad():
-        model.eval()
-        output = model(input).cpu()
 
-        return str(torch.argmax(output, dim=1).numpy()[0])
+@router.get("/{train_id}/artifacts/{name}", response_class=FileResponse)
+async def download_train_artifact(
+    train_id: int,
+    name: str,
+    db: Connection = Depends(get_db),
+):
+    train = await run_in_threadpool(get_train_by_id, train_id, db, True)
+    path = await run_in_threadpool(get_train_artifact_path, train, name, db)
+    if not os.path.exists(path):
+        raise HTTPException(
+            status_code=404, detail="train artifact cannot be found in the server"
+        )
 
+    return FileResponse(path, filename=os.path.basename(path))
 
-@router.post("/{train_id}/test-metrics")
-async def test_metrics_trained_model(
+
+@router.post("/{train_id}/score", response_class=PlainTextResponse)
+def score_table(
     train_id: int,
-    req: RequestTable,
-    to_json: bool = False,
+    req: RequestScore,
+    background_tasks: BackgroundTasks,
     db: Connection = Depends(get_db),
+    session: Session = Depends(get_session),
     kc: KernelClient = Depends(get_client),
 ):
-    train = get_train_by_id(train_id, db)
+    train = get_train_by_id(train_id, db, cached=True)
     if not train.path:
         raise HTTPException(status_code=503, detail="unprepared trained model")
     elif not os.path.exists(train.path):
@@ -79,42 +127,196 @@ async def test_metrics_trained_model(
             status_code=404, detail="trained model cannot be found in the server"
         )
 
+    job = new_score_job(train_id, req, session)
+    if req.partitions > 1:
+        background_tasks.add_task(
+            distributed_score_task, job.id, train_id, train.path, req, kc
+        )
+    else:
+        background_tasks.add_task(score_task, job.id, train_id, train.path, req)
+
+    return str(job.id)
+
+
+@router.get("/{train_id}/score/{job_id}", response_model=ScoreJob)
+def get_score_job_info(
+    train_id: int,
+    job_id: int,
+    session: Session = Depends(get_session),
+):
+    return get_score_job(train_id, job_id, session)
+
+
+async def evaluate_on_kernel(kc: KernelClient, path: str, req: RequestTable):
     kernel = await kc.create_kernel()
     if not kernel:
         raise HTTPException(status_code=503, detail="no providers available")
 
-    model_filename = os.path.split(train.path)[1]
-    await kernel.send_file(train.path, model_filename)
+    model_filename = os.path.split(path)[1]
+    try:
+        await kernel.send_file(path, model_filename)
 
-    result = await kernel.execute(
-        get_test_metrics_source(
-            model_filename,
-            req.table_name,
-            req.label_column_name,
-            req.data_column_name,
-        ),
-        "Test model",
-    )
+        return await kernel.evaluate(
+            get_test_metrics_source(
+                model_filename,
+                req.table_name,
+                req.label_column_name,
+                req.data_column_name,
+                req.key_column_name,
+            ),
+            "Test model",
+        )
+    except ExecutionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await kernel.clear_workspace()
+        await kernel.stop()
 
-    await kernel.clear_workspace()
-    await kernel.stop()
 
-    print(result)
-    try:
-        result = result[result.index("__RESULT__") + 1 :]
+@router.post("/{train_id}/test-metrics")
+async def test_metrics_trained_model(
+    train_id: int,
+    req: RequestTable,
+    to_json: bool = False,
+    variant: str = "default",
+    isolated: bool = Query(
+        False, description="Evaluate on a kernel, not in the local process pool"
+    ),
+    force: bool = Query(False, description="Recompute instead of using the cache"),
+    table_version: str | None = Query(
+        None, description="Version of the test table (default: row count, max key)"
+    ),
+    sample: int | None = Query(
+        None, ge=1, description="Evaluate a stratified sample of this many rows"
+    ),
+    ci_width: float | None = Query(
+        None,
+        gt=0,
+        description="Sample again until the accuracy interval is this narrow (%p)",
+    ),
+    max_sample: int = Query(100000, ge=1),
+    confidence: float = Query(0.95, gt=0, lt=1),
+    db: Connection = Depends(get_db),
+    session: Session = Depends(get_session),
+    kc: KernelClient = Depends(get_client),
+    pool: EvaluationPool = Depends(get_evaluation_pool),
+):
+    train = get_train_by_id(train_id, db)
+    path = get_train_artifact_path(train, variant, db)
+    if not os.path.exists(path):
+        raise HTTPException(
+            status_code=404, detail="trained model cannot be found in the server"
+        )
+
+    if sample is not None:
+        if not pool.workers:
+            raise HTTPException(
+                status_code=503, detail="sample evaluation needs evaluation workers"
+            )
+
+        # Estimates are not cached; a sample is cheap to draw again.
+        try:
+            result = await pool.evaluate_sample(
+                path,
+                req.table_name,
+                req.label_column_name,
+                req.data_column_name,
+                sample,
+                ci_width,
+                max_sample,
+                confidence,
+            )
+        except BrokenProcessPool:
+            # A worker died, not the evaluation; there is no kernel fallback.
+            raise HTTPException(
+                status_code=503, detail="evaluation pool restarted, try again"
+            )
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
         if to_json:
             return result
         else:
-            return PlainTextResponse("\n".join(result))
-    except:
-        raise HTTPException(status_code=400)
+            return PlainTextResponse(format_test_metrics(result))
+
+    digest = await run_in_threadpool(get_artifact_digest, path)
+    if table_version is not None:
+        version = f"user:{table_version}"
+    else:
+        version = await run_in_threadpool(get_table_version, req, db)
+
+    result = None if force else get_cached_test_metrics(digest, req, version, session)
+    if result is not None:
+        metrics.inc("test_metrics.cache_hit")
+    else:
+        metrics.inc("test_metrics.cache_miss")
+        if not isolated:
+            try:
+                # None when every local worker is busy
+                result = await pool.evaluate(
+                    path,
+                    req.table_name,
+                    req.label_column_name,
+                    req.data_column_name,
+                    req.key_column_name,
+                )
+            except BrokenProcessPool:
+                metrics.inc("test_metrics.pool_broken")
+                result = None  # a worker died, not the evaluation
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        if result is None:
+            result = await evaluate_on_kernel(kc, path, req)
+        save_test_metrics(digest, req, version, result, session)
+
+    if to_json:
+        return result
+    else:
+        return PlainTextResponse(format_test_metrics(result))
 
 
 @router.get("/{train_id}/log", response_model=list[TrainLogView])
-def get_train_log(
+async def get_train_log(
     train_id: int,
+    since: str | None = Query(
+        None, description="Return logs after this sequence or ISO timestamp"
+    ),
+    limit: int | None = Query(
+        None, ge=1, le=10000, description="Return at most this many logs"
+    ),
+    wait: float = Query(
+        0, ge=0, le=60, description="Seconds to wait for new logs (long-poll)"
+    ),
     db: Connection = Depends(get_db),
 ):
-    return [
-        TrainLogView(**log.model_dump()) for log in get_train_log_by_id(train_id, db)
-    ]
+    deadline = monotonic() + wait
+    while True:
+        logs = await run_in_threadpool(get_train_log_by_id, train_id, db, since, limit)
+
+        if logs or monotonic() >= deadline:
+            break
+
+        await sleep(settings.log_poll_interval)
+
+    if not logs and since is None:
+        raise HTTPException(status_code=404, detail="train info not found")
+
+    headers = {}
+    if limit and len(logs) == limit and logs[-1]["seq"] is not None:
+        # More logs may follow; pass this as `since` to read them.
+        headers["X-Next-Since"] = str(logs[-1]["seq"])
+
+    return JSONResponse(logs, headers=headers)
+
+
+@router.get("/{train_id}/metrics", response_model=TrainMetricSeries)
+def get_train_metric_series(
+    train_id: int,
+    kind: Literal["step", "epoch"] = "step",
+    points: int = Query(
+        500, ge=1, le=10000, description="Average into at most this many points"
+    ),
+    session: Session = Depends(get_session),
+):
+    return get_train_metrics(train_id, session, kind, points)
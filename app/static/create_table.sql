@@ -16,25 +16,44 @@ CREATE TABLE sys.ML_MODEL_LAYER (
 
 CREATE SEQUENCE sys.SEQ_ML_MODEL_LAYER NOCYCLE;
 
-CREATE TABLE sys.ML_INFERENCE (
-  id NUMBER PRIMARY KEY,
-  data BLOB
-);
-
-CREATE SEQUENCE sys.SEQ_ML_INFERENCE NOCYCLE;
-
 CREATE TABLE sys.ML_TRAIN (
   id NUMBER PRIMARY KEY,
   mid NUMBER REFERENCES sys.ML_MODEL(id),
   kernel CHAR(36),
   status CHAR(50),
-  path VARCHAR2(65532)
+  path VARCHAR2(65532),
+  params VARCHAR2(65532),
+  parent NUMBER REFERENCES sys.ML_TRAIN(id),
+  hwm VARCHAR2(255)
 );
 
 CREATE SEQUENCE sys.SEQ_ML_TRAIN NOCYCLE;
 
+CREATE TABLE sys.ML_TRAIN_ARTIFACT (
+  tid NUMBER REFERENCES sys.ML_TRAIN(id),
+  name VARCHAR2(50),
+  path VARCHAR2(65532),
+  info VARCHAR2(65532),
+  createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE sys.ML_INFERENCE (
+  id NUMBER PRIMARY KEY,
+  data BLOB,
+  tid NUMBER REFERENCES sys.ML_TRAIN(id),
+  key_id VARCHAR2(255),
+  prediction NUMBER
+);
+
+CREATE SEQUENCE sys.SEQ_ML_INFERENCE NOCYCLE;
+
 CREATE TABLE sys.ML_TRAIN_LOG (
   tid NUMBER REFERENCES sys.ML_TRAIN(id),
+  seq NUMBER,
   log VARCHAR2(65532),
   createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+CREATE SEQUENCE sys.SEQ_ML_TRAIN_LOG NOCYCLE;
+
+CREATE INDEX sys.IDX_ML_TRAIN_LOG ON sys.ML_TRAIN_LOG(tid, seq);
\ No newline at end of file
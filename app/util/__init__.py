@@ -1,5 +1,6 @@
 from pathlib import Path
 
+from .lru_cache import LRUCache
 from .sql_reader import sql_reader
 
 static_dir = f"{Path(__file__).parent.parent.absolute()}/static"
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/util/lru_cache.py
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Generic, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class LRUCache(Generic[T]):
+    maxsize: int
+    ttl: float | None
+
+    _entries: "OrderedDict[Hashable, Tuple[T, float]]"
+    _lock: Lock
+
+    def __init__(self, maxsize: int, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def _expires_at(self) -> float:
+        return monotonic() + self.ttl if self.ttl is not None else float("inf")
+
+    def get(self, key: Hashable, default: Any = None) -> T | Any:
+        """Return a value that has not outlived the TTL."""
+        with self._lock:
+            if key not in self._entries:
+                return default
+
+            value, expires_at = self._entries[key]
+            if expires_at < monotonic():
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def peek(self, key: Hashable, default: Any = None) -> T | Any:
+        """Return a value even if it has expired, e.g. to revalidate it."""
+        with self._lock:
+            if key not in self._entries:
+                return default
+
+            return self._entries[key][0]
+
+    def put(self, key: Hashable, value: T) -> None:
+        with self._lock:
+            self._entries[key] = (value, self._expires_at())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> T | Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[0] if entry else default
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
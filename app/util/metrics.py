@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# app/util/metrics.py
+
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict
+
+
+class Timer(object):
+    count: int
+    total: float
+    max: float
+    samples: Deque[float]  # recent samples for percentiles
+
+    def __init__(self, size: int = 1024) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def dump(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics(object):
+    _lock: Lock
+    _counters: Dict[str, float]
+    _timers: Dict[str, Timer]
+    _gauges: Dict[str, Callable[[], Any]]
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._counters = {}
+        self._timers = {}
+        self._gauges = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            if name not in self._timers:
+                self._timers[name] = Timer()
+            self._timers[name].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start)
+
+    def gauge(self, name: str, callback: Callable[[], Any]) -> None:
+        self._gauges[name] = callback
+
+    def dump(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {
+                "counters": dict(self._counters),
+                "timers": {name: t.dump() for name, t in self._timers.items()},
+            }
+
+        result["gauges"] = {name: fn() for name, fn in self._gauges.items()}
+        return result
+
+
+metrics = Metrics()
@@ -2,24 +2,45 @@
 # -*- coding: utf-8 -*-
 # app/util/source_generator.py
 
+import re
+from typing import Dict, List
+
 from app.model.model import Component, Model
 from app.util import static_dir
 
-dataloader_source_origin: str = ""
-with open(f"{static_dir}/jdbc_dataloader.source", "r") as file:
-    dataloader_source_origin = file.read()
 
-network_source_origin: str = ""
-with open(f"{static_dir}/network.source", "r") as file:
-    network_source_origin = file.read()
+class SourceTemplate(object):
+    """
+    A template split once at its {PLACEHOLDER}s, so a source is rendered
+    with one join instead of a str.replace pass over the whole template per
+    placeholder. Placeholders without a value are left as they are.
+    """
+
+    segments: List[str]  # text, placeholder name, text, ..., text
+
+    def __init__(self, template: str) -> None:
+        self.segments = re.split(r"\{([A-Z][A-Z0-9_]*)\}", template)
+
+    def render(self, values: Dict[str, str]) -> str:
+        segments = self.segments.copy()
+        for i in range(1, len(segments), 2):
+            name = segments[i]
+            segments[i] = values[name] if name in values else f"{{{name}}}"
 
-train_source_origin: str = ""
-with open(f"{static_dir}/train.source", "r") as file:
-    train_source_origin = file.read()
+        return "".join(segments)
 
-test_metrics_source: str = ""
-with open(f"{static_dir}/test_metrics.source", "r") as file:
-    test_metrics_source = file.read()
+
+def load_template(filename: str) -> SourceTemplate:
+    with open(f"{static_dir}/{filename}", "r") as file:
+        return SourceTemplate(file.read())
+
+
+dataloader_template = load_template("jdbc_dataloader.source")
+network_template = load_template("network.source")
+train_template = load_template("train.source")
+test_metrics_template = load_template("test_metrics.source")
+score_template = load_template("score.source")
+sweep_template = load_template("sweep.source")
 
 
 def get_dataloader_source(
@@ -29,21 +50,25 @@ def get_dataloader_source(
     testset_table: str,
     testset_label: str,
     testset_data: str,
+    dataset_key: str | None = None,
+    testset_key: str | None = None,
+    since: str | None = None,
+    replay: float = 0.0,
 ) -> str:
-    replaces = [
-        ["{DATASET_TABLE_NAME}", dataset_table],
-        ["{DATASET_LABEL_COLUMN_NAME}", dataset_label],
-        ["{DATASET_DATA_COLUMN_NAME}", dataset_data],
-        ["{TESTSET_TABLE_NAME}", testset_table],
-        ["{TESTSET_LABEL_COLUMN_NAME}", testset_label],
-        ["{TESTSET_DATA_COLUMN_NAME}", testset_data],
-    ]
-
-    source = dataloader_source_origin
-    for old, new in replaces:
-        source = source.replace(old, new)
-
-    return source
+    values = {
+        "DATASET_TABLE_NAME": dataset_table,
+        "DATASET_LABEL_COLUMN_NAME": dataset_label,
+        "DATASET_DATA_COLUMN_NAME": dataset_data,
+        "DATASET_KEY_COLUMN_NAME": dataset_key or "",
+        "TESTSET_TABLE_NAME": testset_table,
+        "TESTSET_LABEL_COLUMN_NAME": testset_label,
+        "TESTSET_DATA_COLUMN_NAME": testset_data,
+        "TESTSET_KEY_COLUMN_NAME": testset_key or "",
+        "SINCE": repr(since),
+        "REPLAY": str(replay),
+    }
+
+    return dataloader_template.render(values)
 
 
 def get_network_source(model: Model) -> str:
@@ -70,46 +95,65 @@ def get_network_source(model: Model) -> str:
         else:
             return source + f"self.{c.name}(input)"
 
-    replaces = [
-        ["{MODEL_CLASS}", model.get_source_classname()],
-        [
-            "{DEFINE_LAYER}",
-            "\n".join(filter(None, [class_init_source(c) for c in model.layers])),
-        ],
-        ["{FORWARD_LAYER}", "\n".join(class_forward_source(c) for c in model.layers)],
-    ]
-
-    source = network_source_origin
-    for old, new in replaces:
-        source = source.replace(old, new)
+    values = {
+        "MODEL_CLASS": model.get_source_classname(),
+        "DEFINE_LAYER": "\n".join(
+            filter(None, [class_init_source(c) for c in model.layers])
+        ),
+        "FORWARD_LAYER": "\n".join(class_forward_source(c) for c in model.layers),
+    }
 
-    return source
+    return network_template.render(values)
 
 
 def get_train_source(
-    model: Model, train_id: int, num_epochs: int, mini_batches: int
+    model: Model,
+    train_id: int,
+    num_epochs: int,
+    mini_batches: int,
+    quantize: str | None = None,
+    calibration_batches: int = 10,
+    checkpoint_every: int = 1,
+    resume_filename: str | None = None,
+    autocast: bool = False,
+    compile: bool = False,
+    autotune: bool = False,
+    profile: bool = False,
+    trace_start: int = 0,
+    trace_steps: int = 0,
+    init_filename: str | None = None,
 ) -> str:
     model_name = model.get_source_name()
-    replaces = [
-        ["{MODEL_CLASS}", model.get_source_classname()],
-        ["{MODEL_NAME}", model_name],
-        ["{LOSS_FN_TYPE}", model.loss_fn.type],
-        ["{LOSS_FN_NAME}", model.loss_fn.name],
-        ["{LOSS_FN_PARAMS}", model.loss_fn.params],
-        ["{OPTIMIZER_TYPE}", model.optimizer.type],
-        ["{OPTIMIZER_NAME}", model.optimizer.name],
-        ["{OPTIMIZER_PARAMS}", model.optimizer.params.replace("{MODEL}", model_name)],
-        ["{OUTPUT_NAME}", f"{model.id}_{model_name}.pt"],
-        ["{TRAIN_ID}", str(train_id)],
-        ["{NUM_EPOCHS}", str(num_epochs)],
-        ["{MINI_BATCHES}", str(mini_batches)],
-    ]
-
-    source = train_source_origin
-    for old, new in replaces:
-        source = source.replace(old, new)
-
-    return source
+    values = {
+        "MODEL_CLASS": model.get_source_classname(),
+        "MODEL_NAME": model_name,
+        "LOSS_FN_TYPE": model.loss_fn.type,
+        "LOSS_FN_NAME": model.loss_fn.name,
+        "LOSS_FN_PARAMS": model.loss_fn.params,
+        "OPTIMIZER_TYPE": model.optimizer.type,
+        "OPTIMIZER_NAME": model.optimizer.name,
+        "OPTIMIZER_PARAMS": model.optimizer.params.replace("{MODEL}", model_name),
+        "OUTPUT_NAME": f"{model.id}_{model_name}.pt",
+        "TRAIN_ID": str(train_id),
+        "NUM_EPOCHS": str(num_epochs),
+        "MINI_BATCHES": str(mini_batches),
+        "QUANTIZE": repr(quantize),
+        "CALIBRATION_BATCHES": str(calibration_batches),
+        "CHECKPOINT_NAME": f"{model.id}_{model_name}.ckpt",
+        "CHECKPOINT_EVERY": str(checkpoint_every),
+        "RESUME_FILENAME": repr(resume_filename),
+        "AUTOCAST": str(autocast),
+        "COMPILE": str(compile),
+        "AUTOTUNE": str(autotune),
+        "MODEL_ID": str(model.id),
+        "PROFILE": str(profile),
+        "TRACE_NAME": f"{model.id}_{model_name}.trace.json",
+        "TRACE_START": str(trace_start),
+        "TRACE_STEPS": str(trace_steps),
+        "INIT_FILENAME": repr(init_filename),
+    }
+
+    return train_template.render(values)
 
 
 def get_test_metrics_source(
@@ -117,16 +161,60 @@ def get_test_metrics_source(
     testset_table: str,
     testset_label: str,
     testset_data: str,
+    testset_key: str | None = None,
+) -> str:
+    values = {
+        "MODEL_FILENAME": model_filename,
+        "TESTSET_TABLE_NAME": testset_table,
+        "TESTSET_LABEL_COLUMN_NAME": testset_label,
+        "TESTSET_DATA_COLUMN_NAME": testset_data,
+        "TESTSET_KEY_COLUMN_NAME": testset_key or "",
+    }
+
+    return test_metrics_template.render(values)
+
+
+def get_score_source(
+    model_filename: str,
+    table_name: str,
+    key_column_name: str,
+    data_column_name: str,
+    insert_sql: str,
+    partition: int,
+    partitions: int,
+    batch_size: int,
+    width: int,
+    height: int,
 ) -> str:
-    replaces = [
-        ["{MODEL_FILENAME}", model_filename],
-        ["{TESTSET_TABLE_NAME}", testset_table],
-        ["{TESTSET_LABEL_COLUMN_NAME}", testset_label],
-        ["{TESTSET_DATA_COLUMN_NAME}", testset_data],
-    ]
-
-    source = test_metrics_source
-    for old, new in replaces:
-        source = source.replace(old, new)
-
-    return source
+    values = {
+        "MODEL_FILENAME": model_filename,
+        "TABLE_NAME": table_name,
+        "KEY_COLUMN_NAME": key_column_name,
+        "DATA_COLUMN_NAME": data_column_name,
+        "INSERT_SQL": insert_sql,
+        "PARTITION": str(partition),
+        "PARTITIONS": str(partitions),
+        "BATCH_SIZE": str(batch_size),
+        "WIDTH": str(width),
+        "HEIGHT": str(height),
+    }
+
+    return score_template.render(values)
+
+
+def get_sweep_source(model: Model, trial_id: int, until_epoch: int) -> str:
+    model_name = model.get_source_name()
+    values = {
+        "MODEL_CLASS": model.get_source_classname(),
+        "MODEL_NAME": model_name,
+        "LOSS_FN_TYPE": model.loss_fn.type,
+        "LOSS_FN_NAME": model.loss_fn.name,
+        "LOSS_FN_PARAMS": model.loss_fn.params,
+        "OPTIMIZER_TYPE": model.optimizer.type,
+        "OPTIMIZER_NAME": model.optimizer.name,
+        "OPTIMIZER_PARAMS": model.optimizer.params.replace("{MODEL}", model_name),
+        "TRIAL_ID": str(trial_id),
+        "UNTIL_EPOCH": str(until_epoch),
+    }
+
+    return sweep_template.render(values)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# kernel/kernel_autotune.py
+
+import hashlib
+import json
+import os
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+from torch.utils.data import DataLoader
+
+PREFETCH_FACTOR = 2  # DataLoader default
+
+
+def get_rss() -> int:
+    with open("/proc/self/statm", "r") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _read_int(path: str) -> int | None:
+    try:
+        with open(path, "r") as file:
+            value = file.read().strip()
+        return None if value == "max" else int(value)
+    except (OSError, ValueError):
+        return None
+
+
+def get_memory_budget(cpus: int) -> int:
+    """
+    Memory this kernel may use: what is available on the machine (or in its
+    cgroup, if that is less), scaled to the kernel's share of the CPUs.
+    """
+    available = 0
+    with open("/proc/meminfo", "r") as file:
+        for line in file:
+            if line.startswith("MemAvailable:"):
+                available = int(line.split()[1]) * 1024
+                break
+
+    limit = _read_int("/sys/fs/cgroup/memory.max")
+    if limit is not None:
+        usage = _read_int("/sys/fs/cgroup/memory.current") or 0
+        available = min(available, max(limit - usage, 0))
+
+    return available * cpus // max(os.cpu_count() or cpus, cpus)
+
+
+def get_batch_sizes(dataset_size: int, low: int = 16, high: int = 512) -> List[int]:
+    sizes = []
+    size = low
+    while size <= high and size <= dataset_size:
+        sizes.append(size)
+        size *= 2
+
+    return sizes or [max(dataset_size, 1)]
+
+
+def get_worker_counts(max_workers: int) -> List[int]:
+    counts = [0]
+    count = 1
+    while count < max_workers:
+        counts.append(count)
+        count *= 2
+    if max_workers > 0:
+        counts.append(max_workers)
+
+    return counts
+
+
+def _measure(
+    loader: DataLoader,
+    step: Callable[[Any], Any],
+    iterations: int,
+    baseline: int,
+) -> Dict | None:
+    batches = iter(loader)
+    try:
+        # The first batch pays for worker start-up and allocator warm-up.
+        batch = next(batches)
+        step(batch)
+        batch_bytes = sum(t.nbytes for t in batch)
+        peak = get_rss()
+
+        samples = 0
+        start = perf_counter()
+        for _ in range(iterations):
+            try:
+                batch = next(batches)
+            except StopIteration:
+                break
+            step(batch)
+            samples += len(batch[-1])
+            peak = max(peak, get_rss())
+        seconds = perf_counter() - start
+    except StopIteration:
+        return None
+    finally:
+        del batches  # shuts the workers down
+
+    if samples == 0:
+        return None
+
+    # Workers live outside this process: each keeps PREFETCH_FACTOR batches
+    # in shared memory plus the one it is collating.
+    workers = loader.num_workers
+    return {
+        "samples_per_sec": samples / seconds,
+        "memory": peak - baseline + batch_bytes * (PREFETCH_FACTOR + 1) * workers,
+    }
+
+
+def autotune_dataloader(
+    make_loader: Callable[[int, int], DataLoader],
+    step: Callable[[Any], Any],
+    batch_sizes: List[int],
+    worker_counts: List[int],
+    memory_budget: int,
+    iterations: int = 10,
+    cache_path: str | None = None,
+    cache_key: str = "",
+    log: Callable = print,
+) -> Dict | None:
+    """
+    Time `iterations` steps of every (batch size, workers) pair and return
+    the {"batch_size", "num_workers", ...} with the highest samples/sec whose
+    estimated memory stays within `memory_budget`.
+
+    `make_loader(batch_size, num_workers)` builds a loader; `step(batch)`
+    must not change the model being trained. The result is kept as json
+    under `cache_path` for `cache_key`; None if nothing fits.
+    """
+    cache_file = None
+    if cache_path:
+        digest = hashlib.sha1(cache_key.encode()).hexdigest()
+        cache_file = f"{cache_path}/autotune/{digest}.json"
+        try:
+            with open(cache_file, "r") as file:
+                best = json.load(file)
+            log(
+                "DataLoader autotune (cached): batch_size=%d, num_workers=%d"
+                % (best["batch_size"], best["num_workers"])
+            )
+            return best
+        except (OSError, ValueError, KeyError):
+            pass
+
+    # RSS never shrinks back, so memory is measured from one baseline and
+    # later configurations are over- rather than under-estimated.
+    baseline = get_rss()
+    best = None
+    for num_workers in worker_counts:
+        for batch_size in sorted(batch_sizes):
+            result = _measure(
+                make_loader(batch_size, num_workers), step, iterations, baseline
+            )
+            if result is None:
+                continue
+
+            fits = result["memory"] <= memory_budget
+            log(
+                "DataLoader autotune: batch_size=%d, num_workers=%d: "
+                "%.1f samples/sec, %.1fMiB%s"
+                % (
+                    batch_size,
+                    num_workers,
+                    result["samples_per_sec"],
+                    result["memory"] / 2**20,
+                    "" if fits else " (over budget)",
+                )
+            )
+            if not fits:
+                break  # larger batches need even more
+
+            if best is None or result["samples_per_sec"] > best["samples_per_sec"]:
+                best = {
+                    "batch_size": batch_size,
+                    "num_workers": num_workers,
+                    **result,
+                }
+
+    if best is None:
+        log("DataLoader autotune: no configuration fits %d bytes" % memory_budget)
+        return None
+
+    log(
+        "DataLoader autotune: batch_size=%d, num_workers=%d (%.1f samples/sec)"
+        % (best["batch_size"], best["num_workers"], best["samples_per_sec"])
+    )
+
+    if cache_file:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(f"{cache_file}.tmp", "w") as file:
+            json.dump(best, file)
+        os.replace(f"{cache_file}.tmp", cache_file)
+
+    return best
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# kernel/kernel_checkpoint.py
+
+import os
+import random
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict
+
+import numpy as np
+import torch
+
+
+def snapshot(value: Any) -> Any:
+    """
+    Copy every tensor of a (nested) state dict to the CPU, so the training
+    loop can keep updating the originals while the copy is written.
+    """
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    elif isinstance(value, dict):
+        return {key: snapshot(item) for key, item in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return type(value)(snapshot(item) for item in value)
+    else:
+        return value
+
+
+def get_rng_state() -> Dict:
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+
+    return state
+
+
+def set_rng_state(state: Dict) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+class CheckpointWriter(object):
+    """
+    Writes training checkpoints to `path` on a background thread.
+
+    `save` only snapshots the state on the caller's thread. A checkpoint
+    requested while the previous one is still being written replaces the
+    pending one instead of queueing behind it. `on_saved(path, info)` is
+    called on the writer thread once a checkpoint is on disk.
+    """
+
+    path: str
+    on_saved: Callable[[str, Dict], Any] | None
+
+    _executor: ThreadPoolExecutor
+    _running: Future | None
+    _pending: Dict | None
+    _lock: Lock
+
+    def __init__(
+        self, path: str, on_saved: Callable[[str, Dict], Any] | None = None
+    ) -> None:
+        self.path = path
+        self.on_saved = on_saved
+
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="checkpoint")
+        self._running = None
+        self._pending = None
+        self._lock = Lock()
+
+    def _write(self) -> None:
+        while True:
+            with self._lock:
+                state, self._pending = self._pending, None
+                if state is None:
+                    self._running = None
+                    return
+
+            torch.save(state, f"{self.path}.tmp")
+            os.replace(f"{self.path}.tmp", self.path)
+
+            if self.on_saved:
+                self.on_saved(self.path, {"epoch": state["epoch"]})
+
+    def save(
+        self,
+        model: torch.nn.Module,
+        optimizer: torch.optim.Optimizer,
+        epoch: int,
+        **extra: Any,
+    ) -> None:
+        state = {
+            "epoch": epoch,
+            "model": snapshot(model.state_dict()),
+            "optimizer": snapshot(optimizer.state_dict()),
+            "rng": get_rng_state(),
+            **snapshot(extra),
+        }
+
+        with self._lock:
+            self._pending = state
+            if self._running is None:
+                self._running = self._executor.submit(self._write)
+
+    def close(self) -> None:
+        with self._lock:
+            running = self._running
+
+        # Raises the error of a failed write, if any.
+        if running is not None:
+            running.result()
+        self._executor.shutdown()
+
+
+def load_checkpoint(
+    path: str, model: torch.nn.Module, optimizer: torch.optim.Optimizer
+) -> Dict:
+    state = torch.load(path, map_location="cpu", weights_only=False)
+
+    model.load_state_dict(state["model"])
+    optimizer.load_state_dict(state["optimizer"])
+    set_rng_state(state["rng"])
+
+    return state
+
+
+def load_weights(path: str, model: torch.nn.Module) -> None:
+    """
+    Initialize `model` from a trained model file: an exported TorchScript
+    model or a checkpoint, of which only the weights are used.
+    """
+    try:
+        state = torch.jit.load(path, map_location="cpu").state_dict()
+    except RuntimeError:
+        state = torch.load(path, map_location="cpu", weights_only=False)["model"]
+
+    model.load_state_dict(state)
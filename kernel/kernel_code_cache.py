@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# kernel/kernel_code_cache.py
+
+import ast
+import hashlib
+import importlib.util
+import inspect
+import linecache
+import marshal
+import os
+import sys
+from types import CodeType
+from typing import Any, Dict, List, Tuple
+
+from app.util.lru_cache import LRUCache
+
+# Smaller cells (e.g. "_SERVER.train_id = 3") run through IPython as usual.
+CODE_CACHE_MIN_SIZE = 1024  # characters
+
+DEFINITIONS = (
+    ast.Import,
+    ast.ImportFrom,
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+)
+
+# (key of a definition run or None, names it binds, code)
+Segment = Tuple[str | None, Tuple[str, ...], CodeType]
+
+
+def _bound_names(nodes: List[ast.stmt]) -> Tuple[str, ...] | None:
+    names = []
+    for node in nodes:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    return None  # binds names we cannot track
+                names.append(alias.asname or alias.name.split(".")[0])
+        else:
+            names.append(node.name)
+
+    return tuple(names)
+
+
+def compile_cell(source: str, filename: str) -> List[Segment]:
+    """
+    Compile a cell into one code object per run of consecutive statements,
+    alternating between definition runs (imports, functions, classes) and
+    everything else. Top-level await is allowed, as in IPython.
+    """
+    runs: List[Tuple[bool, List[ast.stmt]]] = []
+    for node in ast.parse(source, filename).body:
+        definition = isinstance(node, DEFINITIONS)
+        if runs and runs[-1][0] == definition:
+            runs[-1][1].append(node)
+        else:
+            runs.append((definition, [node]))
+
+    segments = []
+    for definition, nodes in runs:
+        module = ast.Module(body=nodes, type_ignores=[])
+        code = compile(
+            module,
+            filename,
+            "exec",
+            flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT,
+            dont_inherit=True,
+        )
+
+        key, names = None, ()
+        if definition and (bound := _bound_names(nodes)) is not None:
+            # Same statements, same objects: line numbers are not part of it.
+            key = hashlib.sha256(ast.dump(module).encode()).hexdigest()
+            names = bound
+        segments.append((key, names, code))
+
+    return segments
+
+
+class CodeCache(object):
+    """
+    Compiled code of the large cells this kernel runs, keyed by the sha256
+    of their source: in memory, and marshalled under `root_path` so every
+    kernel of the provider shares it. `transform` is an IPython input
+    transformer that swaps such a cell for a call to `run`.
+
+    `run` also skips definition runs (imports, functions, classes) already
+    executed in this kernel whose names are still bound to the objects they
+    created, e.g. the helpers of a sweep cell run once per trial.
+    """
+
+    root_path: str
+    hits: int
+    misses: int
+    skipped: int
+
+    _namespace: Dict[str, Any]
+    _sources: Dict[str, str]  # digest -> source, from transform until run
+    _codes: LRUCache[List[Segment]]
+    _defined: Dict[str, Dict[str, Any]]  # definition key -> {name: object}
+
+    def __init__(self, root_path: str, namespace: Dict[str, Any]) -> None:
+        os.makedirs(root_path, exist_ok=True)
+
+        self.root_path = root_path
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+        self._namespace = namespace
+        self._sources = {}
+        self._codes = LRUCache(64)
+        self._defined = {}
+
+    def _get_path(self, digest: str) -> str:
+        # marshal is only readable by the Python version that wrote it.
+        return f"{self.root_path}/{digest}.{sys.implementation.cache_tag}"
+
+    def _read(self, digest: str) -> List[Segment] | None:
+        try:
+            with open(self._get_path(digest), "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+
+        magic = importlib.util.MAGIC_NUMBER
+        if not data.startswith(magic):
+            return None
+
+        try:
+            return marshal.loads(data[len(magic) :])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def _write(self, digest: str, segments: List[Segment]) -> None:
+        path = self._get_path(digest)
+        with open(f"{path}.{os.getpid()}.tmp", "wb") as file:
+            file.write(importlib.util.MAGIC_NUMBER + marshal.dumps(segments))
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def _get(self, digest: str, source: str, filename: str) -> List[Segment]:
+        segments = self._codes.get(digest)
+        if segments is None:
+            segments = self._read(digest)
+
+        if segments is None:
+            self.misses += 1
+            segments = compile_cell(source, filename)
+            try:
+                self._write(digest, segments)
+            except OSError:
+                pass  # still cached in memory
+        else:
+            self.hits += 1
+
+        self._codes.put(digest, segments)
+        return segments
+
+    def _is_defined(self, key: str) -> bool:
+        defined = self._defined.get(key)
+        return defined is not None and all(
+            name in self._namespace and self._namespace[name] is value
+            for name, value in defined.items()
+        )
+
+    def transform(self, lines: List[str]) -> List[str]:
+        source = "".join(lines)
+        if len(source) < CODE_CACHE_MIN_SIZE:
+            return lines
+
+        digest = hashlib.sha256(source.encode()).hexdigest()
+        self._sources[digest] = source
+        return [f"await _SERVER.code_cache.run({digest!r})\n"]
+
+    async def run(self, digest: str) -> None:
+        source = self._sources.pop(digest)
+        filename = f"<cell {digest[:12]}>"
+        # Tracebacks show the cell's lines.
+        linecache.cache[filename] = (
+            len(source),
+            None,
+            source.splitlines(True),
+            filename,
+        )
+
+        for key, names, code in self._get(digest, source, filename):
+            if key is not None and self._is_defined(key):
+                self.skipped += 1
+                continue
+
+            result = eval(code, self._namespace)
+            if code.co_flags & inspect.CO_COROUTINE:
+                await result
+
+            if key is not None:
+                self._defined[key] = {name: self._namespace[name] for name in names}
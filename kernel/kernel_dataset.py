@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# kernel/kernel_dataset.py
+
+import fcntl
+import hashlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import jaydebeapi
+import numpy as np
+import torch
+from PIL import Image
+
+
+def read_blob(blob) -> bytes:
+    return bytes(blob.getBytes(1, int(blob.length())))
+
+
+def get_cpu_count() -> int:
+    return len(os.sched_getaffinity(0))
+
+
+def decode_image(blob: bytes, transform: Callable | None = None) -> np.ndarray:
+    image = Image.open(io.BytesIO(blob))
+
+    if transform is not None:
+        image = transform(image)
+
+    return np.asarray(image, dtype=np.uint8)
+
+
+def _init_decode_worker() -> None:
+    # The pool already spreads work over the kernel's cores.
+    torch.set_num_threads(1)
+
+
+def _iter_decode_images(
+    blobs: List[bytes],
+    transform: Callable | None,
+    workers: int | None,
+    min_chunksize: int,
+) -> Iterator[np.ndarray]:
+    workers = min(workers or get_cpu_count(), math.ceil(len(blobs) / min_chunksize))
+    if workers <= 1:
+        yield from (decode_image(blob, transform) for blob in blobs)
+        return
+
+    chunksize = max(min_chunksize, math.ceil(len(blobs) / (workers * 4)))
+
+    # fork is unsafe here: the kernel already runs zmq and JVM threads.
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_init_decode_worker,
+    ) as pool:
+        yield from pool.map(
+            partial(decode_image, transform=transform), blobs, chunksize=chunksize
+        )
+
+
+def decode_images(
+    blobs: List[bytes],
+    transform: Callable | None = None,
+    workers: int | None = None,
+    min_chunksize: int = 64,
+) -> np.ndarray:
+    """
+    Decode images into one contiguous uint8 array of shape (N, H, W[, C]).
+
+    Decoding and `transform` (PIL level, e.g. Resize) run on a process pool
+    sized to the CPUs this kernel may run on. Results keep the order of
+    `blobs`.
+    """
+    images = None
+    for i, image in enumerate(
+        _iter_decode_images(blobs, transform, workers, min_chunksize)
+    ):
+        if images is None:
+            images = np.empty((len(blobs), *image.shape), dtype=np.uint8)
+        elif image.shape != images.shape[1:]:
+            raise ValueError(
+                f"image {i} has shape {image.shape}, expected {images.shape[1:]} "
+                "(use a Resize transform for tables with mixed image sizes)"
+            )
+        images[i] = image
+
+    return images if images is not None else np.empty((0,), dtype=np.uint8)
+
+
+class NormalizeCollate(object):
+    """
+    collate_fn that turns a batch of uint8 HWC images into a normalized
+    float32 NCHW tensor with one vectorized multiply-add per batch.
+    """
+
+    scale: torch.Tensor
+    bias: torch.Tensor
+
+    def __init__(self, mean: List[float], std: List[float]) -> None:
+        mean = torch.tensor(mean, dtype=torch.float32)
+        std = torch.tensor(std, dtype=torch.float32)
+
+        # (x / 255 - mean) / std == x * scale + bias
+        self.scale = (1.0 / (255.0 * std)).view(1, -1, 1, 1)
+        self.bias = (-mean / std).view(1, -1, 1, 1)
+
+    def __call__(self, batch) -> Tuple[torch.Tensor, torch.Tensor]:
+        if isinstance(batch, tuple):
+            images, labels = batch  # from Dataset.__getitems__
+        else:
+            images, labels = map(np.stack, zip(*batch))
+
+        images = torch.from_numpy(images)
+        if images.dim() == 3:
+            images = images.unsqueeze(-1)
+
+        images = images.permute(0, 3, 1, 2).to(
+            torch.float32, memory_format=torch.contiguous_format
+        )
+
+        return images.mul_(self.scale).add_(self.bias), torch.from_numpy(labels)
+
+
+class DatasetCache(object):
+    """
+    Append-only cache of (label, data) rows fetched from a table.
+
+    Each table keeps a high-water mark on its key column (ROWID when no key
+    column is given). A refresh only fetches rows above the mark and stores
+    them in new shards; existing shards are never rewritten.
+    """
+
+    root_path: str
+    shard_size: int
+
+    def __init__(self, root_path: str, shard_size: int = 10000) -> None:
+        os.makedirs(root_path, exist_ok=True)
+
+        self.root_path = root_path
+        self.shard_size = shard_size
+
+    def _get_path(self, *columns: str) -> str:
+        digest = hashlib.sha1("|".join(columns).upper().encode()).hexdigest()
+        return f"{self.root_path}/{digest}"
+
+    @contextmanager
+    def _lock(self, path: str):
+        with open(f"{path}.lock", "w") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _read_meta(self, path: str) -> Dict | None:
+        try:
+            with open(f"{path}/meta.json", "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, path: str, meta: Dict) -> None:
+        with open(f"{path}/meta.json.tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(f"{path}/meta.json.tmp", f"{path}/meta.json")
+
+    def _count_until(self, cursor, key: str, table: str, hwm: Any) -> int:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {table} WHERE {key} <= {self._bind(key)}",
+            (hwm,),
+        )
+        (count,) = cursor.fetchone()
+
+        return int(count)
+
+    def _is_valid(self, cursor, meta: Dict, key: str, table: str) -> bool:
+        # Rows deleted or inserted below the high-water mark break the
+        # append-only assumption, so the cached shards must be rebuilt.
+        if meta["hwm"] is None:
+            return meta["rows"] == 0
+
+        return self._count_until(cursor, key, table, meta["hwm"]) == meta["rows"]
+
+    def _bind(self, key: str) -> str:
+        return "CHARTOROWID(?)" if key == "ROWID" else "?"
+
+    def _select(self, key: str) -> str:
+        return "ROWIDTOCHAR(ROWID)" if key == "ROWID" else key
+
+    def _refresh(
+        self, cursor, path: str, meta: Dict, key: str, table: str, columns: str
+    ) -> int:
+        query = f"SELECT {self._select(key)}, {columns} FROM {table}"
+        if meta["hwm"] is None:
+            cursor.execute(f"{query} ORDER BY {key}")
+        else:
+            cursor.execute(
+                f"{query} WHERE {key} > {self._bind(key)} ORDER BY {key}",
+                (meta["hwm"],),
+            )
+
+        fetched = 0
+        while True:
+            records = cursor.fetchmany(self.shard_size)
+            if not records:
+                break
+
+            shard = {
+                "keys": [record[0] for record in records],
+                "labels": [record[1] for record in records],
+                "blobs": [read_blob(record[2]) for record in records],
+            }
+
+            filename = f"shard_{len(meta['shards']):05d}.pkl"
+            with open(f"{path}/{filename}", "wb") as file:
+                pickle.dump(shard, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # meta.json is written after every shard so that an interrupted
+            # refresh still keeps the shards fetched so far.
+            meta["shards"].append({"file": filename, "rows": len(records)})
+            meta["rows"] += len(records)
+            meta["hwm"] = shard["keys"][-1]
+            self._write_meta(path, meta)
+
+            fetched += len(records)
+
+        return fetched
+
+    @contextmanager
+    def _open(
+        self,
+        conn: jaydebeapi.Connection,
+        table: str,
+        label_column: str,
+        data_column: str,
+        key_column: str | None,
+        log: Callable,
+        shard: Tuple[int, int] | None,
+    ):
+        """
+        Refresh the cache of a table and yield (path, meta) while it is locked.
+        """
+        key = key_column if key_column else "ROWID"
+        columns = f"{label_column}, {data_column}"
+        path = self._get_path(table, label_column, data_column, key)
+
+        name = table
+        if shard:
+            path = f"{path}.{shard[0]}_{shard[1]}"
+            table = f"(SELECT * FROM {table} WHERE MOD({key}, {shard[1]}) = {shard[0]})"
+
+        os.makedirs(path, exist_ok=True)
+        with self._lock(path):
+            cursor = conn.cursor()
+            try:
+                meta = self._read_meta(path)
+                if meta and not self._is_valid(cursor, meta, key, table):
+                    log(f"Dataset cache of {name} is stale, reloading")
+                    shutil.rmtree(path)
+                    os.makedirs(path)
+                    meta = None
+
+                if meta is None:
+                    meta = {
+                        "table": table,
+                        "key": key,
+                        "hwm": None,
+                        "rows": 0,
+                        "shards": [],
+                    }
+
+                fetched = self._refresh(cursor, path, meta, key, table, columns)
+                log(f"Dataset cache of {name}: {meta['rows']} rows ({fetched} new)")
+            finally:
+                cursor.close()
+
+            yield path, meta
+
+    def _read_shard(self, path: str, shard: Dict) -> Dict:
+        with open(f"{path}/{shard['file']}", "rb") as file:
+            return pickle.load(file)
+
+    def load(
+        self,
+        conn: jaydebeapi.Connection,
+        table: str,
+        label_column: str,
+        data_column: str,
+        key_column: str | None = None,
+        log: Callable = print,
+        shard: Tuple[int, int] | None = None,
+    ) -> Tuple[List[Any], List[bytes]]:
+        """
+        `shard` = (index, count) restricts the rows to MOD(key, count) = index;
+        it needs a numeric key column.
+        """
+        labels, blobs, _ = self.load_since(
+            conn, table, label_column, data_column, key_column, log=log, shard=shard
+        )
+
+        return labels, blobs
+
+    def load_since(
+        self,
+        conn: jaydebeapi.Connection,
+        table: str,
+        label_column: str,
+        data_column: str,
+        key_column: str | None = None,
+        since: Any = None,
+        replay: float = 0.0,
+        seed: int = 0,
+        log: Callable = print,
+        shard: Tuple[int, int] | None = None,
+    ) -> Tuple[List[Any], List[bytes], Any]:
+        """
+        Rows with a key above `since` (every row when None), followed by a
+        random sample of `replay` times as many rows at or below it, and the
+        high-water mark of the cache. Shards are sorted by key, so the old
+        rows are the first COUNT(key <= since) cached rows and only shards
+        holding new or sampled rows are read.
+        """
+        with self._open(
+            conn, table, label_column, data_column, key_column, log, shard
+        ) as (path, meta):
+            old = 0
+            if since is not None:
+                cursor = conn.cursor()
+                try:
+                    old = self._count_until(cursor, meta["key"], meta["table"], since)
+                finally:
+                    cursor.close()
+
+            size = min(round(replay * (meta["rows"] - old)), old)
+            picks = np.sort(np.random.default_rng(seed).choice(old, size, False))
+
+            labels, blobs = [], []
+            replay_labels, replay_blobs = [], []
+            start = 0
+            for shard in meta["shards"]:
+                end = start + shard["rows"]
+                picked = picks[(picks >= start) & (picks < end)] - start
+                if end > old or len(picked):
+                    data = self._read_shard(path, shard)
+                    labels.extend(data["labels"][max(old - start, 0) :])
+                    blobs.extend(data["blobs"][max(old - start, 0) :])
+                    replay_labels.extend(data["labels"][i] for i in picked)
+                    replay_blobs.extend(data["blobs"][i] for i in picked)
+                start = end
+
+            if since is not None:
+                log(f"Rows of {table} after {since}: {len(labels)} ({size} replayed)")
+
+        return labels + replay_labels, blobs + replay_blobs, meta["hwm"]
+
+    def iter_shards(
+        self,
+        conn: jaydebeapi.Connection,
+        table: str,
+        label_column: str,
+        data_column: str,
+        key_column: str | None = None,
+        log: Callable = print,
+    ) -> Iterator[Tuple[List[Any], List[bytes]]]:
+        """
+        Like `load`, but yields (labels, blobs) one cache shard at a time, so
+        memory stays bounded by `shard_size` rows. `conn` is only used before
+        the first shard is yielded. The lock is released while shards are
+        consumed; shards are append-only, so the ones listed stay valid
+        unless a refresh finds the table rewritten.
+        """
+        with self._open(
+            conn, table, label_column, data_column, key_column, log, None
+        ) as (path, meta):
+            shards = list(meta["shards"])
+
+        for shard in shards:
+            data = self._read_shard(path, shard)
+            yield data["labels"], data["blobs"]
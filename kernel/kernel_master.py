@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 # kernel/kernel_master.py
 
-from typing import Dict, Set
+from typing import Dict, List, Set
 
 from kernel.kernel_message import (
     ClientMessage,
@@ -12,10 +12,14 @@ from kernel.kernel_message import (
 )
 from kernel.kernel_node import Flow, KernelNode
 
+GROUP_TIMEOUT = 60.0  # seconds for every member of a kernel group to start
+
 
 class KernelMaster(KernelNode):
     providers: Set[bytes]
+    resources: Dict[bytes, Dict]  # provider -> last UPDATE_PROVIDER body
     clients: Set[bytes]
+    groups: Dict[bytes, Flow]  # kernel groups still waiting for members
     settings: Dict = {
         "limit": 0,
     }
@@ -24,20 +28,25 @@ class KernelMaster(KernelNode):
         super().__init__(NodeType.Master, port=port, root_path=root_path)
 
         self.providers = set()
+        self.resources = {}
         self.clients = set()
+        self.groups = {}
         self.settings["limit"] = limit
 
         # Provider Events
         self.listen(
             ProviderMessage.SPWAN_KERNEL_REPLY, self.on_provider_spwan_kernel_reply
         )
+        self.listen(ProviderMessage.UPDATE_PROVIDER, self.on_provider_update)
 
         # Client Events
         self.listen(ClientMessage.REQ_KERNEL, self.on_client_request_kernel)
+        self.listen(ClientMessage.REQ_KERNEL_GROUP, self.on_client_request_kernel_group)
 
     def on_connect(self, id, type, **_) -> None:
         if NodeType.Provider.type(type):
             self.providers.add(id)
+            self.resources[id] = {}
             self.send(MasterMessage.SETUP_PROVIDER, json_body=self.settings, id=id)
             print(f"providers: {self.providers}")  # XXX: logger
         elif NodeType.Client.type(type):
@@ -47,9 +56,20 @@ class KernelMaster(KernelNode):
             pass  # XXX: logger
 
     def on_disconnect(self, id, _, **__) -> None:
-        if id in self.providers:
-            self.providers.remove(id)
+        if id in self.resources:
+            self.providers.discard(id)
+            del self.resources[id]
             print(f"providers: {self.providers}")  # XXX: logger
+
+            # Members spawning there will never reply.
+            for group in list(self.groups.values()):
+                pending = group.kwargs["pending"]
+                lost = [member for member in pending if pending[member] == id]
+                for member in lost:
+                    del pending[member]
+                    self.del_flow(member)
+                if lost:
+                    self.fail_group(group)
         elif id in self.clients:
             self.clients.remove(id)
             print(f"clients: {self.clients}")  # XXX: logger
@@ -60,6 +80,10 @@ class KernelMaster(KernelNode):
     def on_provider_spwan_kernel_reply(
         self, provider_id, connection, flow=Flow, **_
     ) -> None:
+        if "group" in flow.kwargs:
+            self.on_group_member_reply(flow, connection)
+            return
+
         flow.set_cleanup()
         client_id = flow.args
 
@@ -73,14 +97,84 @@ class KernelMaster(KernelNode):
         if connection:
             self.providers.add(provider_id)
 
+    def on_provider_update(self, provider_id, resources, **_) -> None:
+        self.resources[provider_id] = resources
+
+        # A provider that was full becomes schedulable again once a kernel exits.
+        if resources["free_kernels"] > 0:
+            self.providers.add(provider_id)
+
+    def get_free_cpus(self, provider_id: bytes) -> int:
+        return self.resources.get(provider_id, {}).get("free_cpus", 0)
+
+    def get_cpu_slice(self, provider_id: bytes) -> int:
+        cpus = self.resources.get(provider_id, {}).get("cpus", 0)
+        return max(cpus // max(self.settings["limit"], 1), 1)
+
+    def get_free_slots(self, provider_id: bytes) -> int:
+        resources = self.resources.get(provider_id, {})
+        slots = resources.get("free_kernels", 0)
+        if resources.get("cpus", 0) >= self.settings["limit"]:
+            # Slices do not overlap, so a member needs a whole free one.
+            cpus = self.get_free_cpus(provider_id) // self.get_cpu_slice(provider_id)
+            slots = min(slots, cpus)
+
+        return slots
+
+    def reply_group(self, group: Flow, kernels: List) -> None:
+        del self.groups[group.id]
+
+        group.set_cleanup()
+        self.send(
+            MasterMessage.RES_KERNEL_GROUP,
+            id=group.args,
+            json_body=kernels,
+            flow=group,
+        )
+
+    def fail_group(self, group: Flow) -> None:
+        if group.id not in self.groups:
+            return  # already answered
+
+        # Members that started are sent back, padded with None, so the client
+        # releases them; members starting later are sent on their own.
+        kernels = group.kwargs["kernels"]
+        self.reply_group(
+            group, kernels + [None] * (group.kwargs["size"] - len(kernels))
+        )
+
+    def on_group_member_reply(self, member: Flow, connection) -> None:
+        self.del_flow(member)
+
+        group: Flow = member.kwargs["group"]
+        group.kwargs["pending"].pop(member, None)
+        if group.id not in self.groups:
+            if connection:
+                self.send(
+                    MasterMessage.RES_KERNEL_GROUP,
+                    id=group.args,
+                    json_body=[connection],
+                    flow=group,
+                )
+            return
+
+        group.kwargs["kernels"].append(connection)
+        if not connection:
+            self.fail_group(group)
+        elif len(group.kwargs["kernels"]) == group.kwargs["size"]:
+            self.reply_group(group, group.kwargs["kernels"])
+
     # Client Events
     def on_client_request_kernel(self, client_id, body, flow: Flow, **__) -> None:
         if self.providers:
             flow.args = client_id
 
+            provider_id = max(self.providers, key=self.get_free_cpus)
+            self.providers.remove(provider_id)
+
             self.send(
                 MasterMessage.SPWAN_KERNEL,
-                id=self.providers.pop(),
+                id=provider_id,
                 json_body=body,
                 flow=flow,
             )
@@ -94,6 +188,57 @@ class KernelMaster(KernelNode):
                 flow=flow,
             )
 
+    def on_client_request_kernel_group(self, client_id, body, flow: Flow, **__) -> None:
+        size = body.pop("size")
+        flow.args = client_id
+
+        # Every member takes a slice of the provider with the most free cores
+        # left, so a group spreads over the providers. All of them must fit.
+        slots = {id: self.get_free_slots(id) for id in self.resources}
+        free = {id: self.get_free_cpus(id) for id in self.resources}
+        placement = []
+        for _ in range(size):
+            candidates = [id for id in free if slots[id] > 0]
+            if not candidates:
+                flow.set_cleanup()
+                self.send(
+                    MasterMessage.RES_KERNEL_GROUP,
+                    id=client_id,
+                    json_body=None,
+                    flow=flow,
+                )
+                return
+
+            provider_id = max(candidates, key=free.get)
+            slots[provider_id] -= 1
+            free[provider_id] -= self.get_cpu_slice(provider_id)
+            placement.append(provider_id)
+
+        flow.kwargs["size"] = size
+        flow.kwargs["kernels"] = []
+        flow.kwargs["pending"] = {}  # member flow -> provider
+        self.groups[flow.id] = flow
+        self._ioloop.call_later(GROUP_TIMEOUT, self.fail_group, flow)
+
+        for provider_id in placement:
+            # Booked until the provider's next update reports the kernel.
+            resources = self.resources[provider_id]
+            resources["free_kernels"] = resources.get("free_kernels", 0) - 1
+            resources["free_cpus"] = max(
+                self.get_free_cpus(provider_id) - self.get_cpu_slice(provider_id), 0
+            )
+
+            member = self.new_flow(group=flow)
+            member.args = client_id
+            flow.kwargs["pending"][member] = provider_id
+
+            self.send(
+                MasterMessage.SPWAN_KERNEL,
+                id=provider_id,
+                json_body=body,
+                flow=member,
+            )
+
 
 if __name__ == "__main__":
     import argparse
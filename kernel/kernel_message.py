@@ -37,14 +37,23 @@ class NodeMessage(Enum):
     SETUP_PROVIDER = auto()
     SPWAN_KERNEL = auto()
     SPWAN_KERNEL_REPLY = auto()
+    UPDATE_PROVIDER = auto()
 
     # Client <-> Master
     REQ_KERNEL = auto()
     RES_KERNEL = auto()
+    REQ_KERNEL_GROUP = auto()
+    RES_KERNEL_GROUP = auto()
 
     # Provider <-> Kernel
     READY_KERNEL = auto()
 
+    # Connection <-> Kernel
+    REQ_RENDEZVOUS = auto()
+    RES_RENDEZVOUS = auto()
+    TRAIN_METRICS = auto()
+    EXECUTE_RESULT = auto()
+
     def type(self, value: int) -> bool:
         return self.value == value
 
@@ -68,15 +77,25 @@ class MasterMessage(KernelMessageAuto):
     SETUP_PROVIDER = auto()
     SPWAN_KERNEL = auto()
     RES_KERNEL = auto()
+    RES_KERNEL_GROUP = auto()
 
 
 class ClientMessage(KernelMessageAuto):
     REQ_KERNEL = auto()
+    REQ_KERNEL_GROUP = auto()
 
 
 class ProviderMessage(KernelMessageAuto):
     SPWAN_KERNEL_REPLY = auto()
+    UPDATE_PROVIDER = auto()
 
 
 class KernelMessage(KernelMessageAuto):
     READY_KERNEL = auto()
+    RES_RENDEZVOUS = auto()
+    TRAIN_METRICS = auto()
+    EXECUTE_RESULT = auto()
+
+
+class ConnectionMessage(KernelMessageAuto):
+    REQ_RENDEZVOUS = auto()
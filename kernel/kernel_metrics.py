@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# kernel/kernel_metrics.py
+
+import math
+from statistics import NormalDist
+from typing import Dict, List, Tuple
+
+import torch
+
+
+def _divide(numerator: torch.Tensor, denominator: torch.Tensor) -> torch.Tensor:
+    # 0 / 0 is undefined (NaN), like sklearn's zero_division=np.nan
+    return numerator.double() / denominator.double()
+
+
+def _to_list(values: torch.Tensor) -> List[float | None]:
+    return [None if value != value else value for value in values.tolist()]
+
+
+def _weighted(values: torch.Tensor, support: torch.Tensor) -> float | None:
+    defined = ~values.isnan() & (support > 0)
+    if not defined.any():
+        return None
+
+    weights = support[defined].double()
+    return float((values[defined] * weights).sum() / weights.sum())
+
+
+class ConfusionMatrix(object):
+    """
+    Confusion matrix accumulated per batch with one torch.bincount, so an
+    evaluation keeps O(classes^2) state however many rows it sees. Rows are
+    labels, columns are predictions; it grows when a new class shows up.
+    """
+
+    matrix: torch.Tensor
+
+    def __init__(self, num_classes: int = 0) -> None:
+        self.matrix = torch.zeros((num_classes, num_classes), dtype=torch.int64)
+
+    def _grow(self, num_classes: int) -> None:
+        size = self.matrix.shape[0]
+        if num_classes > size:
+            matrix = torch.zeros((num_classes, num_classes), dtype=torch.int64)
+            matrix[:size, :size] = self.matrix
+            self.matrix = matrix
+
+    def update(self, labels: torch.Tensor, predictions: torch.Tensor) -> None:
+        labels = labels.detach().flatten().to("cpu", torch.int64)
+        predictions = predictions.detach().flatten().to("cpu", torch.int64)
+        if labels.numel() == 0:
+            return
+
+        self._grow(int(torch.maximum(labels.max(), predictions.max())) + 1)
+
+        size = self.matrix.shape[0]
+        self.matrix += torch.bincount(
+            labels * size + predictions, minlength=size * size
+        ).view(size, size)
+
+    def bootstrap(
+        self, iterations: int = 1000, confidence: float = 0.95, seed: int = 0
+    ) -> Dict[str, Tuple[float, float] | None]:
+        """
+        Percentile intervals of the weighted precision, recall and F1 from
+        `iterations` resamples of the matrix. Each row (label) is resampled
+        with its own total, as in a sample stratified by label.
+        """
+        generator = torch.Generator().manual_seed(seed)
+        support = self.matrix.sum(dim=1)
+
+        samples = {"precision": [], "recall": [], "f1": []}
+        for _ in range(iterations):
+            matrix = torch.zeros_like(self.matrix)
+            for label in torch.nonzero(support).flatten().tolist():
+                row = self.matrix[label].double()
+                drawn = torch.multinomial(
+                    row, int(support[label]), replacement=True, generator=generator
+                )
+                matrix[label] = torch.bincount(drawn, minlength=row.numel())
+
+            resampled = ConfusionMatrix()
+            resampled.matrix = matrix
+            result = resampled.compute()
+            for name, values in samples.items():
+                if result[name] is not None:
+                    values.append(result[name])
+
+        alpha = (1 - confidence) / 2
+        intervals = {}
+        for name, values in samples.items():
+            values = torch.tensor(values, dtype=torch.float64)
+            intervals[name] = (
+                (float(values.quantile(alpha)), float(values.quantile(1 - alpha)))
+                if values.numel()
+                else None
+            )
+
+        return intervals
+
+    def compute(self) -> Dict:
+        """
+        Accuracy (%) and support-weighted precision/recall/F1, as with
+        sklearn's average="weighted"; per-class values under "classes".
+        Undefined values (no support or no predictions) are None.
+        """
+        matrix = self.matrix
+        total = int(matrix.sum())
+        true_positive = matrix.diagonal()
+        support = matrix.sum(dim=1)
+
+        predicted = matrix.sum(dim=0)
+
+        precision = _divide(true_positive, predicted)
+        recall = _divide(true_positive, support)
+        # 2TP / (2TP + FP + FN): 0, not undefined, when only one side is 0.
+        f1 = _divide(2 * true_positive, support + predicted)
+
+        return {
+            "total": total,
+            "accuracy": (100 * float(true_positive.sum()) / total if total else None),
+            "precision": _weighted(precision, support),
+            "recall": _weighted(recall, support),
+            "f1": _weighted(f1, support),
+            "classes": {
+                "support": support.tolist(),
+                "precision": _to_list(precision),
+                "recall": _to_list(recall),  # class-wise accuracy
+                "f1": _to_list(f1),
+            },
+            "confusion_matrix": matrix.tolist(),
+        }
+
+
+def wilson_interval(
+    successes: int, total: int, confidence: float = 0.95
+) -> Tuple[float, float] | None:
+    """
+    Wilson score interval of a binomial proportion, in [0, 1].
+    """
+    if total == 0:
+        return None
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = successes / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total))
+
+    return max(center - margin / denominator, 0.0), min(
+        center + margin / denominator, 1.0
+    )
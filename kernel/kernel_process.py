@@ -3,47 +3,88 @@
 # kernel/kernel_process.py
 
 import asyncio
+import json
 import os
 import signal
+import socket
 from multiprocessing import Process
+from threading import Lock
+from time import time
+from typing import Any, Dict, List, Tuple
 
 import jaydebeapi
+import torch
+import torch.distributed as dist
 from ipykernel.kernelapp import IPKernelApp
 from setproctitle import setproctitle
 
 from app.config.tibero import get_db_connection
-from kernel.kernel_message import KernelMessage, NodeType
+from kernel.kernel_code_cache import CodeCache
+from kernel.kernel_message import ConnectionMessage, KernelMessage, NodeType
 from kernel.kernel_node import Flow, KernelNode
 
+METRICS_BATCH_SIZE = 100
+METRICS_FLUSH_INTERVAL = 1.0  # seconds
+
 
 class KernelProcessServer(KernelNode):
     _provider_id: bytes
     _connection_id: bytes | None
     _process: Process
+    _ipykernel: Any  # ipykernel.kernelbase.Kernel, set once the app is ready
     _conn: jaydebeapi.Connection | None
+    _conn_lock: Lock  # the train loop logs from a worker thread
+    _metrics: List[Dict]  # records not sent yet
+    _metrics_lock: Lock
+    _metrics_sent: float
+    cache_path: str
+    code_cache: CodeCache  # set once the app is ready
+    cpus: List[int]
+    num_workers: int  # DataLoader workers fitting the CPU allotment
     train_id: str | None
+    rank: int
+    world_size: int
+    rendezvous: Dict | None  # {"addr", "port"} of rank 0
 
     def __init__(
         self,
         provider_address: str,
         provider_id: bytes,
         root_path: str,
+        cache_path: str,
         process: Process,
     ) -> None:
         super().__init__(NodeType.Kernel, root_path=root_path)
         self.connect(provider_address, id=provider_id)
+        self.cache_path = cache_path
+        self.cpus = process.cpus
+        # One core is left to the training loop itself.
+        self.num_workers = max(len(self.cpus) - 1, 0)
 
         self._provider_id = provider_id
         self._connection_id = None
         self._process = process
+        self._ipykernel = None
         self._conn = (
             get_db_connection(**process.info["db"]) if "db" in process.info else None
         )
+        self._conn_lock = Lock()
+        self._metrics = []
+        self._metrics_lock = Lock()
+        self._metrics_sent = time()
         self.train_id = None
+        self.rank = 0
+        self.world_size = 1
+        self.rendezvous = None
+
+        # Connection Events
+        self.listen(ConnectionMessage.REQ_RENDEZVOUS, self.on_req_rendezvous)
 
     async def on_stop(self):
         if self._conn:
             self._conn.close()
+        if dist.is_initialized():
+            dist.destroy_process_group()
 
     def on_connect(self, id, type, **_) -> None:
         if NodeType.Connection.type(type):
@@ -55,6 +96,63 @@ class KernelProcessServer(KernelNode):
         if id == self._connection_id:
             self._process.stop()
 
+    # Connection Events
+    def on_req_rendezvous(self, id, body, flow: Flow) -> None:
+        self.rank = body["rank"]
+        self.world_size = body["world_size"]
+
+        if body.get("addr"):
+            self.rendezvous = {"addr": body["addr"], "port": body["port"]}
+        else:
+            # Rank 0 hosts the gloo store on a free port of its provider.
+            with socket.socket() as sock:
+                sock.bind(("", 0))
+                port = sock.getsockname()[1]
+            self.rendezvous = {"addr": self._process.host, "port": port}
+
+        flow.set_cleanup()
+        self.send(
+            KernelMessage.RES_RENDEZVOUS, id=id, json_body=self.rendezvous, flow=flow
+        )
+
+    # Distributed
+    def init_process_group(self) -> None:
+        if self.world_size > 1 and not dist.is_initialized():
+            addr, port = self.rendezvous["addr"], self.rendezvous["port"]
+            dist.init_process_group(
+                "gloo",
+                init_method=f"tcp://{addr}:{port}",
+                rank=self.rank,
+                world_size=self.world_size,
+            )
+
+    def get_shard(self) -> Tuple[int, int] | None:
+        return (self.rank, self.world_size) if self.world_size > 1 else None
+
+    def min_across_ranks(self, value: int) -> int:
+        if self.world_size == 1:
+            return value
+
+        tensor = torch.tensor([value])
+        dist.all_reduce(tensor, op=dist.ReduceOp.MIN)
+        return int(tensor.item())
+
+    def gather_across_ranks(self, value) -> List:
+        if self.world_size == 1:
+            return [value]
+
+        objects = [None] * self.world_size
+        dist.all_gather_object(objects, value)
+        return objects
+
+    def broadcast_from_main(self, value):
+        if self.world_size == 1:
+            return value
+
+        objects = [value]
+        dist.broadcast_object_list(objects, src=0)
+        return objects[0]
+
     def send_to_provider(self, *args, **kwargs) -> None:
         self.send(*args, id=self._provider_id, **kwargs)
 
@@ -69,6 +167,61 @@ class KernelProcessServer(KernelNode):
         )
         self.set_train_info(status="done", path=remote_path)
 
+    async def send_artifact_to_connect(
+        self, source_path: str, filename: str, name: str, info: dict | None = None
+    ) -> None:
+        remote_path = await self.send_file(
+            source_path, filename, id=self._connection_id
+        )
+        self.set_train_artifact(name, remote_path, info)
+
+    def send_result(self, result: Any) -> None:
+        """
+        Send the json result of the running cell to the connection, keyed by
+        the cell's msg_id (see KernelConnection.evaluate).
+        """
+        msg_id = self._ipykernel.get_parent("shell")["header"]["msg_id"]
+        self.send_to_connect(
+            KernelMessage.EXECUTE_RESULT,
+            json_body={"msg_id": msg_id, "result": result},
+        )
+        # On the wire before the cell's execute_reply.
+        self._stream.flush()
+
+    def report(self, **record) -> None:
+        """
+        Queue a structured metric record (kind, step, epoch, loss, accuracy,
+        samples_per_sec) for the connection. Records are sent in batches of
+        METRICS_BATCH_SIZE or every METRICS_FLUSH_INTERVAL seconds; safe to
+        call from the train thread.
+        """
+        record["time"] = time()
+        with self._metrics_lock:
+            self._metrics.append(record)
+            if (
+                len(self._metrics) < METRICS_BATCH_SIZE
+                and record["time"] - self._metrics_sent < METRICS_FLUSH_INTERVAL
+            ):
+                return
+
+        self.flush_metrics()
+
+    def flush_metrics(self) -> None:
+        with self._metrics_lock:
+            records, self._metrics = self._metrics, []
+            self._metrics_sent = time()
+
+        if records:
+            # zmq sockets are not thread-safe; the event loop sends them.
+            self._ioloop.add_callback(self._send_metrics, records)
+
+    def _send_metrics(self, records: List[Dict]) -> None:
+        if self._connection_id and self.train_id is not None:
+            self.send_to_connect(
+                KernelMessage.TRAIN_METRICS,
+                json_body={"train_id": self.train_id, "records": records},
+            )
+
     def new_db_connection(self) -> jaydebeapi.Connection:
         if "db" in self._process.info:
             return get_db_connection(**self._process.info["db"])
@@ -80,15 +233,17 @@ class KernelProcessServer(KernelNode):
 
         if self._conn and self.train_id is not None and "log" in self._process.info:
             log = self._process.info["log"]
-            cursor = self._conn.cursor()
 
-            cursor.execute(
-                f"INSERT INTO {log['table']} ({log['id_column']}, {log['log_column']}) VALUES (?, ?);",
-                (self.train_id, message),
-            )
-            self._conn.commit()
-
-            cursor.close()
+            columns = f"{log['id_column']}, {log['seq_column']}, {log['log_column']}"
+            with self._conn_lock:
+                cursor = self._conn.cursor()
+                cursor.execute(
+                    f"INSERT INTO {log['table']} ({columns}) "
+                    f"VALUES (?, {log['sequence']}.NEXTVAL, ?);",
+                    (self.train_id, message),
+                )
+                self._conn.commit()
+                cursor.close()
 
         if stdout:
             print(message)
@@ -97,18 +252,45 @@ class KernelProcessServer(KernelNode):
         self,
         status: str | None = None,
         path: str | None = None,
+        hwm: Any = None,
     ) -> None:
         if self._conn and self.train_id is not None:
             data = [f"KERNEL = '{self._process.kernel_id}'"]
+            params = []
             if status:
                 data.append(f"STATUS = '{status}'")
             if path:
                 data.append(f"PATH = '{path}'")
+            if hwm is not None:
+                # 학습한 dataset 행의 최대 key (이어서 학습할 때 기준)
+                data.append("HWM = ?")
+                params.append(str(hwm))
 
             if data:
+                with self._conn_lock:
+                    cursor = self._conn.cursor()
+                    cursor.execute(
+                        f"UPDATE sys.ML_TRAIN SET {', '.join(data)} "
+                        f"WHERE ID = {self.train_id}",
+                        params,
+                    )
+                    self._conn.commit()
+                    cursor.close()
+
+    def set_train_artifact(
+        self, name: str, path: str, info: dict | None = None
+    ) -> None:
+        if self._conn and self.train_id is not None:
+            with self._conn_lock:
                 cursor = self._conn.cursor()
                 cursor.execute(
-                    f"UPDATE sys.ML_TRAIN SET {', '.join(data)} WHERE ID = {self.train_id}"
+                    "DELETE FROM sys.ML_TRAIN_ARTIFACT WHERE TID = ? AND NAME = ?",
+                    (self.train_id, name),
+                )
+                cursor.execute(
+                    "INSERT INTO sys.ML_TRAIN_ARTIFACT (TID, NAME, PATH, INFO) "
+                    "VALUES (?, ?, ?, ?)",
+                    (self.train_id, name, path, json.dumps(info) if info else None),
                 )
                 self._conn.commit()
                 cursor.close()
@@ -124,6 +306,7 @@ class KernelProcess(Process):
     _provider_port: int
     _provider_id: bytes
     _req_flow: Flow
+    cpus: List[int]
 
     def __init__(
         self,
@@ -134,6 +317,7 @@ class KernelProcess(Process):
         provider_port: int,
         provider_id: bytes,
         flow: Flow,
+        cpus: List[int] | None = None,
     ) -> None:
         super(KernelProcess, self).__init__()
 
@@ -144,6 +328,21 @@ class KernelProcess(Process):
         self._provider_port = provider_port
         self._provider_id = provider_id
         self._req_flow = flow
+        self.cpus = cpus or sorted(os.sched_getaffinity(0))
+
+    @property
+    def host(self) -> str:
+        return self._provider_host
+
+    def pin_cpus(self) -> None:
+        os.sched_setaffinity(0, self.cpus)
+
+        # Thread pools started later (OpenMP, MKL, torch) size themselves from
+        # these, instead of from every core of the machine.
+        threads = str(len(self.cpus))
+        os.environ["OMP_NUM_THREADS"] = threads
+        os.environ["MKL_NUM_THREADS"] = threads
+        torch.set_num_threads(len(self.cpus))
 
     def run(self) -> None:
         loop = asyncio.new_event_loop()
@@ -151,11 +350,13 @@ class KernelProcess(Process):
 
         os.setpgrp()
         setproctitle(f"python kernel {self.kernel_id}")
+        self.pin_cpus()
 
         server = KernelProcessServer(
             f"tcp://{self._provider_host}:{self._provider_port}",
             self._provider_id,
             f"{self._provider_path}/{self.kernel_id}",
+            f"{self._provider_path}/.dataset_cache",
             self,
         )
 
@@ -171,6 +372,12 @@ class KernelProcess(Process):
 
         app.initialize()
         app.cleanup_connection_file()
+        server._ipykernel = app.kernel
+
+        server.code_cache = CodeCache(
+            f"{self._provider_path}/.code_cache", app.shell.user_ns
+        )
+        app.shell.input_transformers_post.append(server.code_cache.transform)
 
         loop.call_later(
             0.5,
@@ -178,6 +385,7 @@ class KernelProcess(Process):
                 KernelMessage.READY_KERNEL,
                 json_body={
                     "kernel_id": self.kernel_id,
+                    "cpus": self.cpus,
                     "connection": {
                         "session_key": app.session.key.decode(),
                         "ip": app.ip,
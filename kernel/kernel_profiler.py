@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# kernel/kernel_profiler.py
+
+import contextlib
+from time import perf_counter
+from typing import Dict
+
+import torch
+from torch.profiler import ProfilerActivity, profile, schedule
+
+
+class StepTimer(object):
+    """
+    Splits each train step into sections with one perf_counter() per mark:
+    `mark(name)` adds the time since the previous mark to `name`. A disabled
+    timer only pays for a method call per mark.
+    """
+
+    enabled: bool
+    sync: bool  # wait for queued CUDA work, or its time lands in a later mark
+    totals: Dict[str, float]
+    steps: int
+
+    _last: float
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.sync = enabled and torch.cuda.is_available()
+        self.totals = {}
+        self.steps = 0
+        self._last = perf_counter()
+
+    def start(self) -> None:
+        self.totals = {}
+        self.steps = 0
+        self._last = perf_counter()
+
+    def mark(self, name: str) -> None:
+        if not self.enabled:
+            return
+
+        if self.sync:
+            torch.cuda.synchronize()
+        now = perf_counter()
+        self.totals[name] = self.totals.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def step(self) -> None:
+        self.steps += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        {section: {"ms": per step, "share": of the timed total}}
+        """
+        total = sum(self.totals.values()) or 1.0
+        return {
+            name: {
+                "ms": 1000 * seconds / max(self.steps, 1),
+                "share": seconds / total,
+            }
+            for name, seconds in self.totals.items()
+        }
+
+    def format(self) -> str:
+        return ", ".join(
+            "%s %.2fms (%.0f%%)" % (name, value["ms"], 100 * value["share"])
+            for name, value in self.summary().items()
+        )
+
+
+def trace_window(path: str, start: int, steps: int):
+    """
+    torch.profiler over steps [start, start + steps) of the loop calling
+    `step()` on it, exported as a Chrome trace to `path`. Returns a no-op
+    context when `steps` is 0.
+    """
+    if not steps:
+        return contextlib.nullcontext(None)
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+
+    warmup = 1 if start > 0 else 0
+    return profile(
+        activities=activities,
+        schedule=schedule(wait=start - warmup, warmup=warmup, active=steps, repeat=1),
+        on_trace_ready=lambda prof: prof.export_chrome_trace(path),
+        record_shapes=True,
+    )
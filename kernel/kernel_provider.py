@@ -4,8 +4,9 @@
 
 import asyncio
 import errno
+import os
 import signal
-from typing import Dict
+from typing import Dict, List
 
 from app.config.settings import get
 from kernel.kernel_message import (
@@ -24,6 +25,9 @@ class KernelProvider(KernelNode):
     host: str
     kernels: Dict[str, KernelProcess]
     limit: int = 0
+    cpus: List[int]
+
+    _cpu_usage: Dict[int, int]  # cpu -> number of kernels pinned to it
 
     def __init__(self, master_address: str, host: str, root_path: str) -> None:
         super().__init__(NodeType.Provider, root_path=root_path)
@@ -31,6 +35,9 @@ class KernelProvider(KernelNode):
 
         self.host = host
         self.kernels = {}
+        self.cpus = sorted(os.sched_getaffinity(0))
+
+        self._cpu_usage = {cpu: 0 for cpu in self.cpus}
 
         # Master Events
         self.listen(MasterMessage.SETUP_PROVIDER, self.on_master_setup)
@@ -47,17 +54,47 @@ class KernelProvider(KernelNode):
             if e.errno != errno.ESRCH:
                 raise
 
+    def allot_cpus(self) -> List[int]:
+        # Every kernel gets an equal share of the cores; least used cores are
+        # taken first, so kernels only share cores when `limit` > cores.
+        size = max(len(self.cpus) // max(self.limit, 1), 1)
+        cpus = sorted(self.cpus, key=lambda cpu: (self._cpu_usage[cpu], cpu))[:size]
+
+        for cpu in cpus:
+            self._cpu_usage[cpu] += 1
+
+        return sorted(cpus)
+
+    def release_cpus(self, kernel: KernelProcess) -> None:
+        for cpu in kernel.cpus:
+            self._cpu_usage[cpu] -= 1
+
+    def update_master(self) -> None:
+        self.send(
+            ProviderMessage.UPDATE_PROVIDER,
+            json_body={
+                "cpus": len(self.cpus),
+                "free_cpus": sum(usage == 0 for usage in self._cpu_usage.values()),
+                "free_kernels": max(self.limit - len(self.kernels), 0),
+            },
+            to_master=True,
+        )
+
     def on_disconnect(self, id, _, **__) -> None:
         for kernel in list(self.kernels.values()):
             if kernel.id != id:
                 continue
 
             self.kill_kernel(kernel)
+            self.release_cpus(kernel)
             del self.kernels[kernel.kernel_id]
 
+            self.update_master()
+
     # Master Events
     def on_master_setup(self, _, settings, **__) -> None:
         self.limit = settings["limit"]
+        self.update_master()
 
     def on_master_spwan_kernel(self, _, info, flow: Flow) -> None:
         if len(self.kernels) >= self.limit:
@@ -80,6 +117,7 @@ class KernelProvider(KernelNode):
                 self._port,
                 self._identity,
                 flow,
+                self.allot_cpus(),
             )
             self.kernels[kernel.kernel_id] = kernel
             kernel.start()
@@ -99,6 +137,7 @@ class KernelProvider(KernelNode):
             flow=flow,
             to_master=True,
         )
+        self.update_master()
 
     async def on_stop(self):
         for kernel in self.kernels.values():
@@ -107,7 +146,6 @@ class KernelProvider(KernelNode):
 
 if __name__ == "__main__":
     import argparse
-    import os
 
     parser = argparse.ArgumentParser(description="Launch a kernel provider")
     parser.add_argument("address", type=str, help="Address of the kernel master")
@@ -8,7 +8,7 @@ from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
 
 import app.router as router
-from app.config import database, kernel, settings
+from app.config import database, evaluation, inference, kernel, scheduler, settings
 from app.config.tibero import get_db_connection
 
 settings = settings.get()
@@ -18,7 +18,13 @@ settings = settings.get()
 async def lifespan(app: FastAPI):
     database.init()
     kernel.init(app)
+    inference.init(app)
+    evaluation.init(app)
+    scheduler.init(app)
     yield
+    await scheduler.stop(app)
+    evaluation.stop(app)
+    inference.stop(app)
     await kernel.stop(app)
 
 
@@ -33,6 +39,7 @@ app.include_router(router.setting)
 app.include_router(router.model)
 app.include_router(router.train)
 app.include_router(router.kernel)
+app.include_router(router.metrics)
 
 
 def custom_openapi():
@@ -0,0 +1,34 @@
+# !/bin/bash
+
+# Every module of the server, master, provider and kernel must import.
+# Modules whose third-party dependencies are not installed here are skipped.
+
+cd "$(dirname "$0")/.."
+
+echo -n "TEST 1: import modules..."
+
+python - <<'PY'
+import importlib
+import pathlib
+import sys
+
+failed = []
+for path in sorted(pathlib.Path(".").glob("[ak]*/**/*.py")):
+    if path.parts[0] not in ("app", "kernel"):
+        continue
+
+    name = ".".join(path.with_suffix("").parts).removesuffix(".__init__")
+    try:
+        importlib.import_module(name)
+    except ModuleNotFoundError as e:
+        if e.name.split(".")[0] in ("app", "kernel"):
+            failed.append(f"{name}: {e}")
+    except Exception as e:
+        failed.append(f"{name}: {type(e).__name__}: {e}")
+
+if failed:
+    print("FAIL")
+    print("\n".join(failed))
+    sys.exit(1)
+print("OK")
+PY